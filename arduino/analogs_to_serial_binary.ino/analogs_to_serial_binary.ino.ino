@@ -0,0 +1,82 @@
+// Binary variant of analogs_to_serial: samples on a timer, and sends each sample as a frame
+//   0xA5 0x5A | sequence (uint8) | N_CHANNELS x uint16, little endian | checksum (uint8)
+// The checksum is the sum, modulo 256, of the sequence and value bytes.
+// The sequence is incremented on every timer tick, so a missed tick shows as a gap.
+//
+// Decode with: serial_listen_lsl_stream.py --protocol binary --srate 1000 --baudrate 230400
+// 16 bytes per frame with 6 channels: 230400 baud carries up to 1440 frames per second.
+
+#define N_CHANNELS 6
+#define SAMPLING_HZ 1000
+#define BAUDRATE 230400
+
+// Smallest Timer1 prescaler for which the compare value fits in the 16 bits of OCR1A,
+// SAMPLING_HZ must be an integer. At 16 MHz, no prescaler works down to 245 Hz, 8 down to 31 Hz.
+#if F_CPU / SAMPLING_HZ <= 65536UL
+#define TIMER1_PRESCALER 1
+#define TIMER1_CLOCK_SELECT (1 << CS10)
+#elif F_CPU / 8 / SAMPLING_HZ <= 65536UL
+#define TIMER1_PRESCALER 8
+#define TIMER1_CLOCK_SELECT (1 << CS11)
+#elif F_CPU / 64 / SAMPLING_HZ <= 65536UL
+#define TIMER1_PRESCALER 64
+#define TIMER1_CLOCK_SELECT ((1 << CS11) | (1 << CS10))
+#elif F_CPU / 256 / SAMPLING_HZ <= 65536UL
+#define TIMER1_PRESCALER 256
+#define TIMER1_CLOCK_SELECT (1 << CS12)
+#elif F_CPU / 1024 / SAMPLING_HZ <= 65536UL
+#define TIMER1_PRESCALER 1024
+#define TIMER1_CLOCK_SELECT ((1 << CS12) | (1 << CS10))
+#else
+#error "SAMPLING_HZ is too low for Timer1"
+#endif
+
+const uint8_t channelPins[N_CHANNELS] = {A0, A1, A2, A3, A4, A5};
+
+volatile uint8_t ticks = 0;
+uint8_t sentTicks = 0;
+
+ISR(TIMER1_COMPA_vect) {
+  ticks++;
+}
+
+void setupTimer() {
+  // Timer1 in CTC mode, interrupts at SAMPLING_HZ
+  noInterrupts();
+  TCCR1A = 0;
+  TCCR1B = (1 << WGM12) | TIMER1_CLOCK_SELECT;
+  TCNT1 = 0;
+  OCR1A = F_CPU / TIMER1_PRESCALER / SAMPLING_HZ - 1;
+  TIMSK1 = (1 << OCIE1A);
+  interrupts();
+}
+
+void setup() {
+  Serial.begin(BAUDRATE);
+  setupTimer();
+}
+
+void loop() {
+  uint8_t now = ticks;
+  if (now == sentTicks) {
+    return;
+  }
+  // when a sample takes longer than a tick, the ticks in between are skipped
+  sentTicks = now;
+
+  uint8_t frame[3 + 2 * N_CHANNELS + 1];
+  frame[0] = 0xA5;
+  frame[1] = 0x5A;
+  frame[2] = now;
+
+  uint8_t checksum = now;
+  for (uint8_t i = 0; i < N_CHANNELS; i++) {
+    uint16_t value = analogRead(channelPins[i]);
+    frame[3 + 2 * i] = value & 0xFF;
+    frame[4 + 2 * i] = value >> 8;
+    checksum += frame[3 + 2 * i] + frame[4 + 2 * i];
+  }
+  frame[3 + 2 * N_CHANNELS] = checksum;
+
+  Serial.write(frame, sizeof(frame));
+}
@@ -1,46 +1,122 @@
+import argparse
 import time
-import random
+
 import numpy as np
-from pylsl import StreamInfo, StreamOutlet
+from pylsl import StreamInfo, StreamOutlet, local_clock
+
+## Load generator: noisy sinusoids on one or many streams from a single process.
+## Without arguments, sends the same stream as before (3 channels at 100 Hz).
+##
+## poetry run python src/generate/generate_random_lsl_stream.py
+## poetry run python src/generate/generate_random_lsl_stream.py --streams 4 --channels 64 --srate 20000
 
 # Define the stream name, type, and number of channels
 stream_name = "RandomDataStream"
 stream_type = "RandomData"
+source_id = "myuid1234"
 sampling_rate = 100
 frequencies = [3, 20, 40]
-num_channels = len(frequencies)
 amplitude = 10
 noise_amplitude = 1
 
-# Create a StreamInfo object to define the stream
-info = StreamInfo(stream_name, stream_type, num_channels, sampling_rate, 'float32', 'myuid1234')
-
-# Create an outlet to send data from this stream
-outlet = StreamOutlet(info)
-
-# Send random data to the stream
-
-start_time = time.time()
-
-
-try:
-    while True:
-        elapsed_time = time.time() - start_time
-
-        # Generate random data (in this case, a float)
-        random_data = [amplitude * np.sin(2 * np.pi * frequency * elapsed_time) + random.uniform(-noise_amplitude, noise_amplitude) for frequency in frequencies]
-
-        # Push the data to the LSL stream
-        outlet.push_sample(random_data)
-
-        # Wait for the next sample (sampling rate)
-        time.sleep(1 / sampling_rate)
-
-except KeyboardInterrupt:
-    print("Streaming stopped.")
-
-
-
-
-
-
+TICK_MS = 10
+STATS_EVERY_S = 5
+
+
+class SinusoidStream():
+    """An outlet of sinusoids plus uniform noise, computed a block of samples at a time.
+
+    Channel i is a sinusoid at frequencies[i % len(frequencies)]. Sample k is
+    at time k / srate from the start, so the signal never drifts whatever
+    the block sizes.
+    """
+
+    def __init__(self, name: str, source_id: str, channel_count: int, srate: float, frequencies, amplitude: float, noise_amplitude: float):
+        self.srate = srate
+        self.amplitude = amplitude
+        self.noise_amplitude = noise_amplitude
+        self.frequencies = np.resize(np.array(frequencies, dtype=np.float64), channel_count)
+        self.rng = np.random.default_rng()
+        self.sent = 0
+
+        # Create a StreamInfo object to define the stream
+        info = StreamInfo(name, stream_type, channel_count, srate, 'float32', source_id)
+
+        # Create an outlet to send data from this stream
+        self.outlet = StreamOutlet(info)
+
+    def next_chunk(self, n_samples: int):
+        t = (self.sent + np.arange(n_samples))[:, np.newaxis] / self.srate
+        chunk = self.amplitude * np.sin(2 * np.pi * self.frequencies * t)
+        chunk += self.rng.uniform(-self.noise_amplitude, self.noise_amplitude, size=chunk.shape)
+        self.sent += n_samples
+        return chunk.astype(np.float32)
+
+    def get_due(self, start: float, now: float):
+        """(chunk, timestamp) of the samples due at `now`, for a stream started at `start` (local_clock)."""
+        n_samples = max(0, int((now - start) * self.srate) - self.sent)
+        chunk = self.next_chunk(n_samples)
+        # the timestamp comes from the schedule, not from when we woke up
+        return chunk, start + (self.sent - 1) / self.srate
+
+    def push_due(self, start: float, now: float):
+        """Push all the samples due at `now`, for a stream started at `start` (local_clock)."""
+        chunk, timestamp = self.get_due(start, now)
+        if len(chunk) > 0:
+            self.outlet.push_chunk(chunk, timestamp)
+        return len(chunk)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Send noisy sinusoids on LSL streams.")
+    parser.add_argument("--streams", type=int, default=1, help="number of streams")
+    parser.add_argument("--channels", type=int, default=len(frequencies), help="number of channels per stream")
+    parser.add_argument("--srate", type=float, default=sampling_rate, help="sampling rate of each stream")
+    parser.add_argument("--frequencies", type=float, nargs="+", default=frequencies, help="sinusoid frequencies, cycled over the channels")
+    parser.add_argument("--amplitude", type=float, default=amplitude)
+    parser.add_argument("--noise-amplitude", type=float, default=noise_amplitude)
+    parser.add_argument("--name", default=stream_name, help="stream name, suffixed with the stream number when there are many")
+    parser.add_argument("--tick-ms", type=float, default=TICK_MS, help="period of the chunks")
+    args = parser.parse_args()
+
+    streams = []
+    for i in range(args.streams):
+        suffix = "" if args.streams == 1 else f"_{i}"
+        streams.append(SinusoidStream(
+            f"{args.name}{suffix}",
+            f"{source_id}{suffix}",
+            args.channels,
+            args.srate,
+            args.frequencies,
+            args.amplitude,
+            args.noise_amplitude,
+        ))
+    print(f"Sending {args.streams} stream(s) of {args.channels} channel(s) at {args.srate} Hz")
+
+    start = local_clock()
+    next_tick = start
+    last_stats = start
+    pushed = 0
+
+    try:
+        while True:
+            # absolute schedule, the time spent pushing does not accumulate
+            next_tick += args.tick_ms / 1000
+            time.sleep(max(0, next_tick - local_clock()))
+
+            now = local_clock()
+            for stream in streams:
+                pushed += stream.push_due(start, now)
+
+            if now - last_stats > STATS_EVERY_S:
+                expected = args.streams * args.srate
+                print(f"{pushed / (now - last_stats):.0f} samples/s pushed, {expected:.0f} expected")
+                last_stats = now
+                pushed = 0
+
+    except KeyboardInterrupt:
+        print("Streaming stopped.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,4 @@
 import time
-import random
-import numpy as np
 from pylsl import StreamInfo, StreamOutlet, local_clock
 
 SLEEP_TIME = 0.5
@@ -8,17 +6,24 @@ SLEEP_TIME = 0.5
 # Define the stream name, type, and number of channels
 stream_name = "RandomStrStream"
 stream_type = "RandomStr"
+source_id = "my_random_string"
+event = "foo"
 
-info = StreamInfo(stream_name, stream_type, 1, 0, 'string', 'my_random_string')
-outlet = StreamOutlet(info)
 
-try:
-    while True:
-        #input('Press enter to send an event')
-        outlet.push_sample(['foo'], local_clock())
-        print('.')
-        time.sleep(SLEEP_TIME)
+def main():
+    info = StreamInfo(stream_name, stream_type, 1, 0, 'string', source_id)
+    outlet = StreamOutlet(info)
 
-except KeyboardInterrupt:
-    print("Streaming stopped.")
+    try:
+        while True:
+            #input('Press enter to send an event')
+            outlet.push_sample([event], local_clock())
+            print('.')
+            time.sleep(SLEEP_TIME)
 
+    except KeyboardInterrupt:
+        print("Streaming stopped.")
+
+
+if __name__ == "__main__":
+    main()
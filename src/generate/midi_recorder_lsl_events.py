@@ -1,14 +1,16 @@
-import time
+import argparse
+import queue
+import threading
 
 from pylsl import StreamInfo, StreamOutlet, local_clock
 from rtmidi import MidiIn # this is package python-rtmidi
 from rtmidi.midiconstants import NOTE_ON, NOTE_OFF
 from rtmidi.midiutil import open_midiinput
-from mido import MidiFile, MidiTrack, Message
+from mido import MidiFile, MidiTrack, Message, bpm2tempo, second2tick
 
 ### Examples of useful Linux commands
 ## play a midi file
-# wildmidi /tmp/output_recording.mid
+# wildmidi /tmp/output_recording_0000.mid
 #
 ## list midi input devices
 # aconnect -i
@@ -16,28 +18,55 @@ from mido import MidiFile, MidiTrack, Message
 ## record to midi file
 # arecordmidi -p 28:0 /tmp/output_recording.mid
 
-file_path = "/tmp/output_recording.mid"
+notes_stream_name = "PianoNotesStream"
 
-print("Available MIDI input ports:")
-for i, port in enumerate(MidiIn().get_ports()):
-    print(f"{i}: {port}")
+file_prefix = "/tmp/output_recording"
+midi_port = "28:0"
 
+# the recording is saved in a new file every SEGMENT_S, so that a long session
+# does not grow in memory, and a crash loses at most one segment
+SEGMENT_S = 60
+
+TICKS_PER_BEAT = 480
+TEMPO = bpm2tempo(120)
+
+LOWEST_KEY = 21
+HIGHEST_KEY = 108
+
+# channels of the numeric notes stream
+NOTE_CHANNELS = ["note", "velocity", "on", "midi_channel"]
+
+
+class MidiRecorder(threading.Thread):
+    """Send the notes received from a MIDI input on LSL, and save them to MIDI files.
+
+    The rtmidi callback only puts the messages in a queue, this thread does
+    everything else. Timestamps are anchored on local_clock at the first
+    message, then accumulated from the deltas measured by rtmidi, which
+    are more accurate than the time at which the messages are dequeued.
+    """
 
-class MidiRecorder:
     def __init__(
             self,
+            notes_outlet: StreamOutlet,
+            file_prefix: str = file_prefix,
+            segment_s: float = SEGMENT_S,
             on_start=None,
             on_lowest_key=None,
             on_highest_key=None,
             reset_on_lowest_key=True,
             reset_on_highest_key=True,
         ):
+        super().__init__(daemon=True)
+        self.notes_outlet = notes_outlet
+        self.file_prefix = file_prefix
+        self.segment_s = segment_s
 
-        self.track = MidiTrack()
-        self.midi_file = MidiFile()
-        self.midi_file.tracks.append(self.track)
+        # SimpleQueue.put never blocks, and can be called from any thread
+        self.queue = queue.SimpleQueue()
 
         self.started = False
+        self.timestamp = None
 
         self.on_start = on_start
         self.on_lowest_key = on_lowest_key
@@ -46,51 +75,153 @@ class MidiRecorder:
         self.reset_on_lowest_key = reset_on_lowest_key
         self.reset_on_highest_key = reset_on_highest_key
 
-    def note_on(self, message):
-        """Handle 'note_on' messages and add them to the MIDI track."""
+        self.segment_id = 0
+        self.track = None
+        self.segment_start = None
+        self.last_tick = 0
+
+    def midi_in_callback(self, event, data=None):
+        # runs in the thread of rtmidi, nothing else is done here
+        self.queue.put(event)
+
+    def run(self):
+        running = True
+        while running:
+            # all the messages already waiting are pushed together
+            events = []
+            try:
+                events.append(self.queue.get(timeout=1))
+                while True:
+                    events.append(self.queue.get_nowait())
+            except queue.Empty:
+                pass
+
+            # None is put by stop()
+            if None in events:
+                events = events[:events.index(None)]
+                running = False
+
+            samples, timestamps = self.get_chunk(events)
+            if len(samples) > 0:
+                self.notes_outlet.push_chunk(samples, timestamps)
+            self.save_segment_if_due()
+
+        self.save_segment()
+
+    def get_chunk(self, events):
+        """(samples, timestamps) of the notes of the rtmidi `events`, which are all recorded."""
+        samples = []
+        timestamps = []
+        for message, delta_time in events:
+            timestamp = self.get_timestamp(delta_time)
+            self.record(message, timestamp)
+
+            status = message[0] & 0xF0
+            if status not in (NOTE_ON, NOTE_OFF) or len(message) < 3:
+                continue
+            _status, note, velocity = message[:3]
+            # a note on with a velocity of 0 is a note off
+            on = 1 if status == NOTE_ON and velocity > 0 else 0
+            samples.append([note, velocity, on, message[0] & 0x0F])
+            timestamps.append(timestamp)
+
+            if on:
+                self.note_on(note)
+
+        return samples, timestamps
+
+    def get_timestamp(self, delta_time: float):
+        now = local_clock()
+        if self.timestamp is None:
+            self.timestamp = now
+        else:
+            self.timestamp += delta_time
+
+        # the clock of rtmidi drifts from local_clock, a message cannot be from the future
+        self.timestamp = min(self.timestamp, now)
+        return self.timestamp
+
+    def note_on(self, note: int):
         if self.started == False:
             print("Started")
-            self.last_time = time.time()
             self.started = True
-            if on_start is not None:
-                on_start()
+            if self.on_start is not None:
+                self.on_start()
 
-        print(f"Note On: {message}")
-        _status, note, velocity = message
-        delta_time = int((time.time() - self.last_time) * 1000)
-        self.track.append(Message('note_on', note=note, velocity=velocity, time=delta_time))
-        self.last_time = time.time()
-
-        if note == 21:
+        if note == LOWEST_KEY:
             if self.reset_on_lowest_key:
                 self.started = False
 
             if self.on_lowest_key is not None:
                 self.on_lowest_key()
 
-        if note == 108:
+        if note == HIGHEST_KEY:
             if self.reset_on_highest_key:
                 self.started = False
 
             if self.on_highest_key is not None:
                 self.on_highest_key()
-            
-
-    def note_off(self, message):
-        """Handle 'note_off' messages and add them to the MIDI track."""
-        print(f"Note Off: {message}")
-        _status, note, velocity = message
-        delta_time = int((time.time() - self.last_time) * 1000)
-        self.track.append(Message('note_off', note=note, velocity=velocity, time=delta_time))
-        self.last_time = time.time()
-
-    def save(self, filename):
-        """Save the recorded MIDI file."""
-        self.midi_file.save(filename)
+
+    def record(self, message, timestamp: float):
+        """Add a message to the track of the current segment."""
+        try:
+            midi_message = Message.from_bytes(message)
+        except ValueError:
+            # such as a truncated system exclusive message
+            return
+
+        if self.track is None:
+            self.track = MidiTrack()
+            self.segment_start = timestamp
+            self.last_tick = 0
+
+        # absolute ticks, so that rounding errors do not add up
+        tick = second2tick(timestamp - self.segment_start, TICKS_PER_BEAT, TEMPO)
+        self.track.append(midi_message.copy(time=max(0, tick - self.last_tick)))
+        self.last_tick = max(tick, self.last_tick)
+
+    def save_segment_if_due(self):
+        if self.segment_start is not None and local_clock() - self.segment_start > self.segment_s:
+            self.save_segment()
+
+    def save_segment(self):
+        """Save the recorded MIDI file of the current segment, and start a new one."""
+        if self.track is None:
+            return
+
+        midi_file = MidiFile(ticks_per_beat=TICKS_PER_BEAT)
+        midi_file.tracks.append(self.track)
+        filename = f"{self.file_prefix}_{self.segment_id:04d}.mid"
+        midi_file.save(filename)
         print(f"MIDI file saved as {filename}")
 
+        self.segment_id += 1
+        self.track = None
+        self.segment_start = None
+
+    def stop(self):
+        self.queue.put(None)
+
+
+def create_notes_outlet(name: str, source_id: str):
+    info = StreamInfo(name, "PianoNotes", len(NOTE_CHANNELS), 0, 'int16', source_id)
+    channels = info.desc().append_child("channels")
+    for label in NOTE_CHANNELS:
+        channels.append_child("channel").append_child_value("label", label)
+    return StreamOutlet(info)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Send the notes of a MIDI input on LSL, and save them to MIDI files.")
+    parser.add_argument("--port", default=midi_port, help="MIDI input, see `aconnect -i`")
+    parser.add_argument("--output", default=file_prefix, help="prefix of the MIDI files, one per segment")
+    parser.add_argument("--segment", type=float, default=SEGMENT_S, help="seconds of recording per MIDI file")
+    args = parser.parse_args()
+
+    print("Available MIDI input ports:")
+    for i, port in enumerate(MidiIn().get_ports()):
+        print(f"{i}: {port}")
 
-if __name__ == "__main__":
     stream_name = "PianoStream"
     stream_type = "Piano"
     stream_source_id = "piano"
@@ -98,39 +229,44 @@ if __name__ == "__main__":
     lsl_info = StreamInfo(stream_name, stream_type, 1, 0, 'string', stream_source_id)
     lsl_outlet = StreamOutlet(lsl_info)
 
+    notes_outlet = create_notes_outlet(notes_stream_name, f"{stream_source_id}_notes")
+
     def on_start():
         print("sending lsl message 'start'")
         lsl_outlet.push_sample(['start'], local_clock())
-        
+
     def on_lowest_key():
         print("sending lsl message 'lowest_key'")
         lsl_outlet.push_sample(['lowest_key'], local_clock())
-        
+
     def on_highest_key():
         print("sending lsl message 'highest_key'")
         lsl_outlet.push_sample(['highest_key'], local_clock())
-        
-    recorder = MidiRecorder(on_start=on_start, on_lowest_key=on_lowest_key, on_highest_key=on_highest_key)
 
-    def midi_in_callback(event, data=None):
-        message, delta_time = event
-
-        if message[0] & 0xF0 == NOTE_ON:
-            recorder.note_on(message)
-
-        if message[0] & 0xF0 == NOTE_OFF:
-            recorder.note_off(message)
+    recorder = MidiRecorder(
+        notes_outlet,
+        file_prefix=args.output,
+        segment_s=args.segment,
+        on_start=on_start,
+        on_lowest_key=on_lowest_key,
+        on_highest_key=on_highest_key,
+    )
+    recorder.start()
 
     try:
         # Set up the callback function
-        with open_midiinput('28:0', client_name='my_client')[0] as midi_in:
-            midi_in.set_callback(midi_in_callback)
+        with open_midiinput(args.port, client_name='my_client')[0] as midi_in:
+            midi_in.set_callback(recorder.midi_in_callback)
 
             print("Waiting for messages")
-            while True:
-                time.sleep(1)
+            recorder.join()
 
     except (EOFError, KeyboardInterrupt):
         print("Bye.")
 
-    recorder.save(file_path)
+    recorder.stop()
+    recorder.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+import shutil
+from typing import List
+
+import numpy as np
+
+## On-disk cache of decoded records, so that replays do not decode the same files
+## on every run. An entry is a directory named by the hash of the content of the
+## record files, with the samples in data.npy and the metadata in meta.json.
+
+CACHE_DIR = "data/cache/"
+CACHE_MAX_BYTES = 4 * 1024 ** 3
+
+HASH_BLOCK_BYTES = 1024 ** 2
+
+
+class RecordCache():
+    """Decoded records, memory-mapped on read, evicted least recently used first.
+
+    Hashing large files takes time, so the hash of each file is remembered
+    with its size and modification time, and only computed again when they
+    change.
+    """
+
+    def __init__(self, cache_dir: str = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hashes_path = os.path.join(cache_dir, "hashes.json")
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def get_file_hash(self, path: str, hashes):
+        stat = os.stat(path)
+        path = os.path.abspath(path)
+        known = hashes.get(path)
+        if known is not None and known["size"] == stat.st_size and known["mtime_ns"] == stat.st_mtime_ns:
+            return known["hash"]
+
+        file_hash = hashlib.sha256()
+        with open(path, "rb") as f:
+            while block := f.read(HASH_BLOCK_BYTES):
+                file_hash.update(block)
+
+        hashes[path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "hash": file_hash.hexdigest()}
+        return hashes[path]["hash"]
+
+    def get_key(self, paths: List[str], options: str = ""):
+        """Key of a record made of the files at `paths`, decoded with `options`."""
+        hashes = {}
+        if os.path.exists(self.hashes_path):
+            with open(self.hashes_path) as f:
+                hashes = json.load(f)
+
+        key = hashlib.sha256(options.encode())
+        for path in sorted(paths):
+            key.update(self.get_file_hash(path, hashes).encode())
+
+        self.write_json(self.hashes_path, hashes)
+        return key.hexdigest()
+
+    def get(self, key: str):
+        """(data, meta) of the entry, data memory-mapped, or None if not cached."""
+        entry_path = os.path.join(self.cache_dir, key)
+        if not os.path.isdir(entry_path):
+            return None
+
+        with open(os.path.join(entry_path, "meta.json")) as f:
+            meta = json.load(f)
+        data = np.load(os.path.join(entry_path, "data.npy"), mmap_mode="r")
+
+        # the modification time of the entry is its last use, for the eviction
+        os.utime(entry_path)
+        return data, meta
+
+    def put(self, key: str, meta, blocks, shape, dtype):
+        """Write an entry from (samples, channels) blocks, without holding the whole record in memory."""
+        entry_path = os.path.join(self.cache_dir, key)
+        tmp_path = f"{entry_path}.{os.getpid()}.tmp"
+        os.makedirs(tmp_path)
+
+        try:
+            data = np.lib.format.open_memmap(os.path.join(tmp_path, "data.npy"), mode="w+", dtype=dtype, shape=shape)
+            start = 0
+            for block in blocks:
+                data[start:start + len(block)] = block
+                start += len(block)
+            assert start == shape[0]
+            data.flush()
+            del data
+
+            self.write_json(os.path.join(tmp_path, "meta.json"), meta)
+            # an entry appears complete or not at all, the first one written wins
+            if os.path.isdir(entry_path):
+                shutil.rmtree(tmp_path)
+            else:
+                os.rename(tmp_path, entry_path)
+        except BaseException:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+
+        self.evict(keep=key)
+        return self.get(key)
+
+    def evict(self, keep: str):
+        entries = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            entry_path = os.path.join(self.cache_dir, name)
+            if not os.path.isdir(entry_path) or name.endswith(".tmp"):
+                continue
+            size = sum(entry.stat().st_size for entry in os.scandir(entry_path))
+            entries.append((os.stat(entry_path).st_mtime, name, size))
+            total += size
+
+        for _, name, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            print(f"Evicting {name} from the record cache")
+            shutil.rmtree(os.path.join(self.cache_dir, name), ignore_errors=True)
+            total -= size
+
+    def write_json(self, path: str, content):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(content, f)
+        os.replace(tmp_path, path)
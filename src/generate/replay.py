@@ -0,0 +1,152 @@
+import argparse
+import math
+import time
+from typing import List
+
+import numpy as np
+import scipy.io.wavfile
+from pylsl import StreamInfo, StreamOutlet, local_clock
+
+## Replay engine shared by the replay_* scripts: sources of samples, one per
+## stream, are replayed in a loop with push_chunk. Sources are read a block at a
+## time, so a record does not have to fit in memory.
+
+TICK_MS = 20
+STATS_EVERY_S = 5
+
+# at speed "max", seconds of record pushed on each stream per iteration
+MAX_SPEED_CHUNK_S = 1
+
+
+class ArraySource():
+    """Samples of a stream from 1-D channel arrays of the same length.
+
+    Arrays can be memory-mapped, only the blocks read are loaded.
+    """
+
+    def __init__(self, channels: List[np.ndarray]):
+        lengths = set(len(channel) for channel in channels)
+        if len(lengths) != 1:
+            raise ValueError(f"Channels do not have the same length: {lengths}")
+
+        self.channels = channels
+        self.channel_count = len(channels)
+        self.length = lengths.pop()
+        self.dtype = np.result_type(*channels)
+
+    def read(self, start: int, stop: int):
+        block = np.empty((stop - start, self.channel_count), dtype=self.dtype)
+        for channel_id, channel in enumerate(self.channels):
+            block[:, channel_id] = channel[start:stop]
+        return block
+
+
+def read_wav(path: str):
+    """Sampling rate and samples of a WAV file, memory-mapped instead of loaded."""
+    return scipy.io.wavfile.read(path, mmap=True)
+
+
+class ReplayStream():
+    """An outlet replaying a source in a loop.
+
+    A source has `channel_count`, `length` (in samples), `dtype` and
+    `read(start, stop)`, which returns a (samples, channels) block.
+    """
+
+    def __init__(self, name: str, stream_type: str, srate: float, source, channel_format: str, source_id: str):
+        self.name = name
+        self.srate = srate
+        self.source = source
+        self.sent = 0
+
+        info = StreamInfo(name, stream_type, source.channel_count, srate, channel_format, source_id)
+        self.outlet = StreamOutlet(info)
+
+    def read(self, start: int, n_samples: int):
+        """n_samples from sample `start`, wrapping around the end of the source."""
+        chunk = np.empty((n_samples, self.source.channel_count), dtype=self.source.dtype)
+        position = start % self.source.length
+        done = 0
+        while done < n_samples:
+            count = min(n_samples - done, self.source.length - position)
+            chunk[done:done + count] = self.source.read(position, position + count)
+            done += count
+            position = 0
+        return chunk
+
+    def read_until(self, record_start: float, position: float):
+        """(chunk, timestamp) of the samples of the record not sent yet, up to `position` seconds.
+
+        Sample k is stamped record_start + k / srate, so the streams of an
+        engine share one clock and keep their alignment.
+        """
+        n_samples = max(0, int(position * self.srate) - self.sent)
+        chunk = self.read(self.sent, n_samples)
+        self.sent += n_samples
+        return chunk, record_start + (self.sent - 1) / self.srate
+
+    def push_until(self, record_start: float, position: float):
+        """Push the samples of the record up to `position` seconds."""
+        chunk, timestamp = self.read_until(record_start, position)
+        if len(chunk) > 0:
+            self.outlet.push_chunk(chunk, timestamp)
+        return len(chunk)
+
+
+class ReplayEngine():
+    """Replay streams at `speed` times real time, or as fast as possible with math.inf.
+
+    Timestamps follow the record: at speed 1 they match local_clock, at
+    other speeds the samples keep their original spacing and run ahead of
+    (or behind) local_clock.
+    """
+
+    def __init__(self, streams: List[ReplayStream], speed: float = 1, tick_ms: float = TICK_MS):
+        self.streams = streams
+        self.speed = speed
+        self.tick_ms = tick_ms
+
+    def run(self):
+        start = local_clock()
+        next_tick = start
+        position = 0.0
+        last_stats = start
+        last_stats_position = 0.0
+
+        try:
+            while True:
+                if math.isinf(self.speed):
+                    position += MAX_SPEED_CHUNK_S
+                else:
+                    # absolute schedule, the time spent pushing does not accumulate
+                    next_tick += self.tick_ms / 1000
+                    time.sleep(max(0, next_tick - local_clock()))
+                    position = (local_clock() - start) * self.speed
+
+                for stream in self.streams:
+                    stream.push_until(start, position)
+
+                now = local_clock()
+                if now - last_stats > STATS_EVERY_S:
+                    speed = (position - last_stats_position) / (now - last_stats)
+                    print(f"Replayed {position:.0f} s of record, at {speed:.1f}x real time")
+                    last_stats = now
+                    last_stats_position = position
+
+        except KeyboardInterrupt:
+            print("Streaming stopped.")
+
+
+def parse_speed(text: str):
+    if text == "max":
+        return math.inf
+    speed = float(text)
+    # at 0 the replay stalls, below it would go backwards
+    if not speed > 0:
+        raise argparse.ArgumentTypeError(f"speed must be positive, or 'max': {text}")
+    return speed
+
+
+def add_replay_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--speed", type=parse_speed, default=1, help="multiple of real time, or 'max' to replay as fast as possible")
+    parser.add_argument("--tick-ms", type=float, default=TICK_MS, help="period of the chunks")
@@ -1,8 +1,14 @@
-import time
-import random
+import argparse
+import glob
+import os
+
 import numpy as np
-import mne
-from pylsl import StreamInfo, StreamOutlet
+
+from record_cache import RecordCache
+from replay import ArraySource, ReplayEngine, ReplayStream, add_replay_arguments
+
+## poetry run python src/generate/replay_nirs_to_lsl_stream.py
+## poetry run python src/generate/replay_nirs_to_lsl_stream.py --speed max
 
 stream_name = "ReplayNIRS"
 stream_type = "NIRS"
@@ -10,47 +16,94 @@ stream_type = "NIRS"
 # For testing, Data from the dataset "Dataset of parent-child hyperscanning fNIRS recordings"
 # https://researchdata.ntu.edu.sg/dataset.xhtml?persistentId=doi:10.21979/N9/35DNCW
 file_path = "data/examples/child/NIRS-2019-09-28_002.hdr"
-raw = mne.io.read_raw_nirx(file_path, preload=True, verbose=True)
-#n_channels = len(raw.info['ch_names'])
 n_channels = 6
-srate = raw.info['sfreq']
 
-print(raw)
+WINDOW_S = 30
+
+# the stream is float32, the cache stores the same
+CACHE_DTYPE = np.float32
+
+
+class RawWindowSource():
+    """Samples of an mne Raw opened without preload, decoded one window at a time.
+
+    Only the window being replayed is in memory. A window is decoded when
+    the replay leaves the previous one, so most reads are slices.
+    """
+
+    def __init__(self, raw, picks, window_s: float = WINDOW_S):
+        self.raw = raw
+        self.picks = picks
+        self.channel_count = len(picks)
+        self.length = raw.n_times
+        self.dtype = float
+        self.window_samples = int(window_s * raw.info['sfreq'])
+
+        self.window = None
+        self.window_start = 0
 
-# Create a StreamInfo object to define the stream
-info = StreamInfo(stream_name, stream_type, n_channels, srate, 'float32', 'myuid1234')
+    def read(self, start: int, stop: int):
+        if self.window is None or start < self.window_start or stop > self.window_start + len(self.window):
+            window_stop = min(self.length, max(stop, start + self.window_samples))
+            # mne returns (channels, samples)
+            self.window = self.raw.get_data(picks=self.picks, start=start, stop=window_stop).T
+            self.window_start = start
 
-# Create an outlet to send data from this stream
-outlet = StreamOutlet(info)
+        return self.window[start - self.window_start:stop - self.window_start]
 
-# Send random data to the stream
 
-start_time = time.time()
-raw_data = raw.get_data()
-ptr = 0
+def read_raw_nirx(path: str):
+    # importing mne takes seconds, it is only needed when decoding
+    import mne
 
-try:
-    while True:
-        elapsed_time = time.time() - start_time
+    # without preload, only the headers are read here
+    raw = mne.io.read_raw_nirx(path, preload=False, verbose=True)
+    print(raw)
+    return raw
 
-        # Generate random data (in this case, a float)
-        data = raw_data[:n_channels,ptr]
-        #print(data)
 
-        # Push the data to the LSL stream
-        outlet.push_sample(data)
+def read_cached_nirx(path: str, cache: RecordCache):
+    """(samples, channels) array and metadata of a NIRx record, decoded once then memory-mapped."""
+    # a NIRx record is the set of files sharing the name of the header
+    paths = glob.glob(f"{glob.escape(os.path.splitext(path)[0])}*")
+    key = cache.get_key(paths, options=f"nirx/{np.dtype(CACHE_DTYPE).name}")
 
-        # Wait for the next sample (sampling rate)
-        time.sleep(1 / srate)
-        ptr += 1
-        if ptr == raw_data.shape[0]:
-            ptr = 0
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
 
-except KeyboardInterrupt:
-    print("Streaming stopped.")
+    print(f"Decoding {path} into the record cache")
+    raw = read_raw_nirx(path)
+    source = RawWindowSource(raw, list(range(len(raw.ch_names))))
+    blocks = (
+        source.read(start, min(start + source.window_samples, source.length)).astype(CACHE_DTYPE)
+        for start in range(0, source.length, source.window_samples)
+    )
+    meta = {"sfreq": raw.info['sfreq'], "ch_names": raw.ch_names}
+    return cache.put(key, meta, blocks, (source.length, source.channel_count), CACHE_DTYPE)
 
 
+def main():
+    parser = argparse.ArgumentParser(description="Replay a NIRx record on an LSL stream.")
+    parser.add_argument("--file", default=file_path, help="NIRx header file")
+    parser.add_argument("--channels", type=int, default=n_channels, help="number of channels replayed")
+    parser.add_argument("--no-cache", action="store_true", help="decode the record while replaying, without the record cache")
+    add_replay_arguments(parser)
+    args = parser.parse_args()
 
+    if args.no_cache:
+        raw = read_raw_nirx(args.file)
+        srate = raw.info['sfreq']
+        source = RawWindowSource(raw, list(range(args.channels)))
+    else:
+        data, meta = read_cached_nirx(args.file, RecordCache())
+        srate = meta["sfreq"]
+        source = ArraySource(list(data[:, :args.channels].T))
+        print(f"Replaying {', '.join(meta['ch_names'][:args.channels])}")
 
+    stream = ReplayStream(stream_name, stream_type, srate, source, 'float32', 'myuid1234')
+    ReplayEngine([stream], speed=args.speed, tick_ms=args.tick_ms).run()
 
 
+if __name__ == "__main__":
+    main()
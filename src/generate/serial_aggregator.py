@@ -0,0 +1,200 @@
+import argparse
+import json
+import os
+import selectors
+import time
+
+import serial
+from pylsl import StreamInfo, StreamOutlet, local_clock
+
+from serial_listen_lsl_stream import BinaryFrameDecoder, CsvDecoder
+from serial_listen_lsl_stream_events import EventLineDecoder
+
+## Listen to many serial ports from one thread, each port with its own LSL stream.
+## The ports are in a JSON config, see serial_aggregator.example.json.
+##
+## poetry run python src/generate/serial_aggregator.py src/generate/serial_aggregator.example.json
+
+STATS_EVERY_S = 5
+RECONNECT_EVERY_S = 2
+DEFAULT_BAUDRATE = 115200
+
+
+class SerialPort():
+    """A serial port of the config, with its decoder, its outlet and its counters.
+
+    "kind" is "samples", decoded with the "protocol" (csv or binary) of
+    serial_listen_lsl_stream, or "events", decoded as debounced lines.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.port = config["port"]
+        self.baudrate = config.get("baudrate", DEFAULT_BAUDRATE)
+        self.kind = config.get("kind", "samples")
+        self.serial = None
+        source_id = config.get("source_id", f"serial_{os.path.basename(self.port)}")
+
+        if self.kind == "samples":
+            channels = config["channels"]
+            self.srate = config["srate"]
+            if config.get("protocol", "csv") == "csv":
+                self.decoder = CsvDecoder(channels)
+                channel_format = 'int16'
+            else:
+                self.decoder = BinaryFrameDecoder(channels)
+                channel_format = 'int32'
+            info = StreamInfo(config.get("name", "SerialIntStream"), config.get("type", "SerialInt"), channels, self.srate, channel_format, source_id)
+        elif self.kind == "events":
+            self.decoder = EventLineDecoder(config.get("debounce_s", 0.05))
+            info = StreamInfo(config.get("name", "SerialStrStream"), config.get("type", "SerialStr"), 1, 0, 'string', source_id)
+        else:
+            raise ValueError(f"Unknown kind {self.kind} for port {self.port}")
+        self.outlet = StreamOutlet(info)
+
+        self.bytes = 0
+        self.values = 0
+        self.read_errors = 0
+        self.reconnects = 0
+        self.failed_opens = 0
+        self.next_open = 0.0
+        self.open_error = None
+
+    def open(self):
+        try:
+            # non blocking, reads are only done when the selector reports data
+            self.serial = serial.Serial(self.port, self.baudrate, timeout=0)
+        except (serial.SerialException, OSError) as e:
+            # printed once, not on every retry
+            if self.open_error != str(e):
+                print(f"Failed to open {self.port}: {e}")
+                self.open_error = str(e)
+            self.serial = None
+            self.next_open = time.perf_counter() + RECONNECT_EVERY_S
+            return False
+
+        print(f"Listening on {self.port} at {self.baudrate} baud ({self.kind})")
+        self.open_error = None
+        return True
+
+    def close(self):
+        if self.serial is not None:
+            self.serial.close()
+            self.serial = None
+
+    def read_chunk(self):
+        """(chunk, timestamps) of the bytes waiting, the chunk is empty when no value is complete."""
+        data = self.serial.read(max(1, self.serial.in_waiting))
+        if len(data) == 0:
+            return [], None
+        now = local_clock()
+        self.bytes += len(data)
+
+        if self.kind == "events":
+            timestamps, events = self.decoder.decode(data, now)
+            return events, timestamps
+
+        chunk, ticks = self.decoder.decode(data)
+        if ticks is None:
+            return chunk, now
+        return chunk, (now + ticks / self.srate).tolist()
+
+    def read(self):
+        chunk, timestamps = self.read_chunk()
+        if len(chunk) > 0:
+            self.outlet.push_chunk(chunk, timestamps)
+            self.values += len(chunk)
+
+    def get_stats(self, elapsed: float, previous):
+        previous_bytes, previous_values = previous
+        line = (
+            f"  {self.port:20s} {'open' if self.serial is not None else 'closed':6s}"
+            f"   {(self.bytes - previous_bytes) / elapsed:9.0f} B/s"
+            f"   {(self.values - previous_values) / elapsed:8.1f} {self.kind}/s"
+            f"   decode errors {self.decoder.errors}"
+            f"   read errors {self.read_errors}"
+            f"   reconnects {self.reconnects}"
+            f"   failed opens {self.failed_opens}"
+        )
+        if isinstance(self.decoder, BinaryFrameDecoder):
+            line += f"   missing {self.decoder.gaps}"
+        return line
+
+
+class SerialAggregator():
+    """Wait on all the ports with a selector, and read the ones with data."""
+
+    def __init__(self, ports):
+        self.ports = ports
+        self.selector = selectors.DefaultSelector()
+
+    def open(self, port: SerialPort):
+        if not port.open():
+            port.failed_opens += 1
+            return False
+        self.selector.register(port.serial.fileno(), selectors.EVENT_READ, port)
+        return True
+
+    def close(self, port: SerialPort):
+        if port.serial is not None:
+            self.selector.unregister(port.serial.fileno())
+            port.close()
+
+    def run(self):
+        for port in self.ports:
+            self.open(port)
+
+        last_stats = time.perf_counter()
+        previous = {port.port: (0, 0) for port in self.ports}
+        while True:
+            # with no port open, select would return at once
+            if len(self.selector.get_map()) > 0:
+                events = self.selector.select(timeout=1)
+            else:
+                events = []
+                time.sleep(1)
+
+            for key, _ in events:
+                port = key.data
+                try:
+                    port.read()
+                except (serial.SerialException, OSError) as e:
+                    # unplugged, it is opened again later
+                    print(f"Failed to read {port.port}: {e}")
+                    port.read_errors += 1
+                    self.close(port)
+                    port.next_open = time.perf_counter() + RECONNECT_EVERY_S
+
+            now = time.perf_counter()
+            for port in self.ports:
+                if port.serial is None and now >= port.next_open and self.open(port):
+                    port.reconnects += 1
+
+            if now - last_stats > STATS_EVERY_S:
+                print("Ports")
+                for port in self.ports:
+                    print(port.get_stats(now - last_stats, previous[port.port]))
+                    previous[port.port] = (port.bytes, port.values)
+                last_stats = now
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Push the data of many serial ports on LSL streams, from a single process.")
+    parser.add_argument("config", help="JSON file with a list of ports")
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        config = json.load(f)
+
+    ports = [SerialPort(port_config) for port_config in config["ports"]]
+    aggregator = SerialAggregator(ports)
+    try:
+        aggregator.run()
+    except KeyboardInterrupt:
+        for port in ports:
+            aggregator.close(port)
+        print("Streaming stopped.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,16 @@
-import time
-import threading
+import argparse
+import warnings
 
+import numpy as np
 import serial
 from pylsl import StreamInfo, StreamOutlet, local_clock
 
+## Push the samples sent by arduino/analogs_to_serial.ino (lines of integers) or
+## arduino/analogs_to_serial_binary.ino (binary frames) on an LSL stream.
+##
+## poetry run python src/generate/serial_listen_lsl_stream.py --port /dev/ttyACM0
+## poetry run python src/generate/serial_listen_lsl_stream.py --protocol binary --srate 1000 --baudrate 230400
+
 srate = 50
 
 stream_name = "SerialIntStream"
@@ -11,38 +18,197 @@ stream_type = "SerialInt"
 
 n_channels = 6
 
-info = StreamInfo(stream_name, stream_type, n_channels, srate, 'int16', 'serial_int')
-outlet = StreamOutlet(info)
+port = '/dev/ttyACM0'
+baudrate = 115200
+
+# a read returns when bytes are available, or after this timeout
+READ_TIMEOUT_S = 0.1
+
+
+class CsvDecoder():
+    """Decode lines of comma separated integers, all the complete lines of a buffer at once.
+
+    Lines that do not have n_channels values, such as the first one when
+    we start listening in the middle of a message, are skipped.
+    """
+
+    def __init__(self, n_channels: int):
+        self.n_channels = n_channels
+        self.remainder = b""
+        self.errors = 0
+
+    def is_complete(self, line: bytes):
+        # np.fromstring reads an empty field as 0, a truncated line such as "1,2,3,4,5," must not get there
+        line = line.replace(b" ", b"").replace(b"\t", b"")
+        return (
+            line.count(b",") == self.n_channels - 1
+            and not line.startswith(b",")
+            and not line.endswith(b",")
+            and b",," not in line
+        )
+
+    def decode(self, data: bytes):
+        """(samples, ticks) of the lines completed by `data`, samples as a (samples, channels) array.
+
+        Lines carry no sequence number, ticks is None: samples are assumed
+        to be consecutive.
+        """
+        data = self.remainder + data
+        end = data.rfind(b"\n") + 1
+        self.remainder = data[end:]
+
+        lines = data[:end].split(b"\n")
+        valid = [line for line in (line.strip() for line in lines) if self.is_complete(line)]
+        self.errors += sum(1 for line in lines if line.strip() != b"") - len(valid)
+        if len(valid) == 0:
+            return np.zeros((0, self.n_channels), dtype=np.int32), None
+
+        try:
+            with warnings.catch_warnings():
+                # depending on the numpy version, np.fromstring warns and stops,
+                # or raises, on what is not a number
+                warnings.simplefilter("ignore", DeprecationWarning)
+                values = np.fromstring(b",".join(valid).decode("ascii", errors="replace"), dtype=np.int32, sep=",")
+            if len(values) == len(valid) * self.n_channels:
+                return values.reshape(-1, self.n_channels), None
+        except ValueError:
+            pass
+
+        # a corrupted line, only then are lines parsed one by one
+        samples = []
+        for line in valid:
+            try:
+                samples.append([int(x) for x in line.split(b",")])
+            except ValueError:
+                self.errors += 1
+        return np.array(samples, dtype=np.int32).reshape(-1, self.n_channels), None
+
+
+FRAME_SYNC = b"\xa5\x5a"
+
+
+class BinaryFrameDecoder():
+    """Decode the frames of arduino/analogs_to_serial_binary.ino, all the frames of a buffer at once.
+
+    A frame is FRAME_SYNC, a uint8 sequence number, n_channels uint16 and
+    a uint8 checksum, the sum of the sequence and value bytes. Frames are
+    looked for at every sync, so the decoder resynchronizes after
+    corrupted or lost bytes.
+    """
+
+    def __init__(self, n_channels: int):
+        self.n_channels = n_channels
+        self.frame_size = len(FRAME_SYNC) + 1 + 2 * n_channels + 1
+        self.remainder = b""
+        self.last_sequence = None
+
+        # bytes skipped because they were not part of a valid frame
+        self.errors = 0
+        # samples missing according to the sequence numbers
+        self.gaps = 0
+
+    def decode(self, data: bytes):
+        """(samples, ticks) of the frames completed by `data`.
+
+        ticks are the sample periods from each sample to the last one,
+        negative, so that samples lost in between do not shift the
+        timestamps.
+        """
+        data = self.remainder + data
+        buffer = np.frombuffer(data, dtype=np.uint8)
+
+        # candidate frames start on a sync and are complete
+        last_start = len(buffer) - self.frame_size
+        starts = np.flatnonzero((buffer[:-1] == FRAME_SYNC[0]) & (buffer[1:] == FRAME_SYNC[1]))
+        starts = starts[starts <= last_start]
+
+        frames = buffer[starts[:, np.newaxis] + np.arange(self.frame_size)]
+        checksums = frames[:, 2:-1].sum(axis=1, dtype=np.uint32) & 0xFF
+        valid = checksums == frames[:, -1]
+        starts, frames = starts[valid], frames[valid]
+
+        # a sync inside the payload of the previous frame kept is not a frame,
+        # candidates left out must not hide the frames after them
+        kept = np.zeros(len(starts), dtype=bool)
+        next_start = 0
+        for i, start in enumerate(starts):
+            if start >= next_start:
+                kept[i] = True
+                next_start = start + self.frame_size
+        starts, frames = starts[kept], frames[kept]
+
+        # what could still be the start of a frame is kept for the next call
+        end = starts[-1] + self.frame_size if len(starts) > 0 else 0
+        end = max(end, min(len(buffer), last_start + 1))
+        self.remainder = data[end:]
+        self.errors += end - len(starts) * self.frame_size
+
+        if len(starts) == 0:
+            return np.zeros((0, self.n_channels), dtype=np.int32), np.zeros(0)
+
+        sequences = frames[:, 2].astype(np.int64)
+        if self.last_sequence is not None:
+            sequences = np.concatenate([[self.last_sequence], sequences])
+        steps = np.diff(sequences) % 256
+        if self.last_sequence is None:
+            steps = np.concatenate([[1], steps])
+        self.last_sequence = int(frames[-1, 2])
+        self.gaps += int(np.sum(steps - 1))
+
+        ticks = np.cumsum(steps)
+        values = np.ascontiguousarray(frames[:, 3:-1]).view("<u2").astype(np.int32)
+        return values, (ticks - ticks[-1]).astype(np.float64)
+
+
+def read_serial(ser: serial.Serial, decoder, outlet: StreamOutlet, srate: float):
+    print(f"Listening on {ser.port} at {ser.baudrate} baud...")
+    while True:
+        # blocks until a byte arrives, then takes all the bytes already there
+        data = ser.read(max(1, ser.in_waiting))
+        if len(data) == 0:
+            continue
+        now = local_clock()
+
+        chunk, ticks = decoder.decode(data)
+        if len(chunk) == 0:
+            continue
+
+        # the last sample is stamped with the time of the read, the previous
+        # ones are computed back from the nominal rate
+        if ticks is None:
+            outlet.push_chunk(chunk, now)
+        else:
+            outlet.push_chunk(chunk, (now + ticks / srate).tolist())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Push the integers sent on a serial port on an LSL stream.")
+    parser.add_argument("--port", default=port, help="serial device, such as /dev/ttyACM0")
+    parser.add_argument("--baudrate", type=int, default=baudrate)
+    parser.add_argument("--channels", type=int, default=n_channels)
+    parser.add_argument("--srate", type=float, default=srate, help="nominal rate of the device")
+    parser.add_argument("--protocol", choices=["csv", "binary"], default="csv", help="lines of integers, or binary frames")
+    args = parser.parse_args()
+
+    if args.protocol == "csv":
+        decoder = CsvDecoder(args.channels)
+    else:
+        decoder = BinaryFrameDecoder(args.channels)
+
+    # binary frames carry uint16, which do not fit in int16
+    channel_format = 'int16' if args.protocol == "csv" else 'int32'
+    info = StreamInfo(stream_name, stream_type, args.channels, args.srate, channel_format, 'serial_int')
+    outlet = StreamOutlet(info)
 
-def handle_message(data):
     try:
-        stripped = data.decode('utf-8').strip()
-        print(stripped)
-        if stripped is not '':
-            values = [int(x) for x in stripped.split(',')]
-
-            # If we started listening in the middle of a message, we will not have a complete reading
-            if len(values) == n_channels:
-                outlet.push_sample(values, local_clock())
-    except:
-        print(f"Failed to parse received data: {data}")
-        
+        with serial.Serial(args.port, args.baudrate, timeout=READ_TIMEOUT_S) as ser:
+            read_serial(ser, decoder, outlet, args.srate)
+    except KeyboardInterrupt:
+        if args.protocol == "csv":
+            print(f"Streaming stopped, {decoder.errors} invalid lines.")
+        else:
+            print(f"Streaming stopped, {decoder.errors} bytes skipped, {decoder.gaps} samples missing.")
 
-port = '/dev/ttyACM0'
-baudrate = 115200
 
-def read_serial():
-    with serial.Serial(port, baudrate, timeout=None) as ser:  # No timeout for blocking reads
-        print(f"Listening on {port} at {baudrate} baud...")
-        while True:
-            if ser.in_waiting > 0:
-                data = ser.readline()
-                if data:
-                    handle_message(data)  # Process the data
-
-# Start a new thread to handle serial reading without blocking the main thread
-serial_thread = threading.Thread(target=read_serial, daemon=True)
-serial_thread.start()
-
-while True:
-    time.sleep(1)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -1,43 +1,88 @@
-import time
-import threading
+import argparse
 
 import serial
 from pylsl import StreamInfo, StreamOutlet, local_clock
 
+## Push the lines sent by arduino/push_button.ino as LSL events.
+##
+## poetry run python src/generate/serial_listen_lsl_stream_events.py --port /dev/ttyACM0
+
 stream_name = "SerialStrStream"
 stream_type = "SerialStr"
 
-info = StreamInfo(stream_name, stream_type, 1, 0, 'string', 'serial_str')
-outlet = StreamOutlet(info)
-
 debounce_delay = 0.05
-last_debounce_time = 0.0
-
-
-def handle_message(data):
-    global debounce_delay, last_debounce_time
-    msg = data.decode('utf-8').strip()
-    now = local_clock()
-    if (now - last_debounce_time) > debounce_delay:
-        print(f"Received message: {msg}")
-        outlet.push_sample([msg], local_clock())
-        last_debounce_time = now
 
 port = '/dev/ttyACM0'
 baudrate = 115200
 
-def read_serial():
-    with serial.Serial(port, baudrate, timeout=None) as ser:  # No timeout for blocking reads
-        print(f"Listening on {port} at {baudrate} baud...")
-        while True:
-            if ser.in_waiting > 0:
-                data = ser.readline()
-                if data:
-                    handle_message(data)  # Process the data
-
-# Start a new thread to handle serial reading without blocking the main thread
-serial_thread = threading.Thread(target=read_serial, daemon=True)
-serial_thread.start()
-
-while True:
-    time.sleep(1)
\ No newline at end of file
+# a read returns when bytes are available, or after this timeout
+READ_TIMEOUT_S = 0.1
+
+
+class EventLineDecoder():
+    """Decode lines as events, dropping the ones less than `debounce_delay` after the previous event."""
+
+    def __init__(self, debounce_delay: float):
+        self.debounce_delay = debounce_delay
+        self.last_debounce_time = 0.0
+        self.remainder = b""
+        self.errors = 0
+        # events dropped by the debounce
+        self.bounces = 0
+
+    def decode(self, data: bytes, now: float):
+        """(timestamps, events) of the lines completed by `data`, received at `now`."""
+        data = self.remainder + data
+        end = data.rfind(b"\n") + 1
+        self.remainder = data[end:]
+
+        timestamps = []
+        events = []
+        for line in data[:end].split(b"\n"):
+            msg = line.decode('utf-8', errors='replace').strip()
+            if msg == "":
+                continue
+            if (now - self.last_debounce_time) <= self.debounce_delay:
+                self.bounces += 1
+                continue
+            timestamps.append(now)
+            events.append([msg])
+            self.last_debounce_time = now
+        return timestamps, events
+
+
+def read_serial(ser: serial.Serial, decoder: EventLineDecoder, outlet: StreamOutlet):
+    print(f"Listening on {ser.port} at {ser.baudrate} baud...")
+    while True:
+        # blocks until a byte arrives, then takes all the bytes already there
+        data = ser.read(max(1, ser.in_waiting))
+        if len(data) == 0:
+            continue
+
+        timestamps, events = decoder.decode(data, local_clock())
+        for event in events:
+            print(f"Received message: {event[0]}")
+        if len(events) > 0:
+            outlet.push_chunk(events, timestamps)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Push the lines sent on a serial port as LSL events.")
+    parser.add_argument("--port", default=port, help="serial device, such as /dev/ttyACM0")
+    parser.add_argument("--baudrate", type=int, default=baudrate)
+    parser.add_argument("--debounce", type=float, default=debounce_delay, help="seconds during which events following an event are dropped")
+    args = parser.parse_args()
+
+    info = StreamInfo(stream_name, stream_type, 1, 0, 'string', 'serial_str')
+    outlet = StreamOutlet(info)
+    decoder = EventLineDecoder(args.debounce)
+
+    try:
+        with serial.Serial(args.port, args.baudrate, timeout=READ_TIMEOUT_S) as ser:
+            read_serial(ser, decoder, outlet)
+    except KeyboardInterrupt:
+        print("Streaming stopped.")
+
+
+if __name__ == "__main__":
+    main()
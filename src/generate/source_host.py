@@ -0,0 +1,400 @@
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import math
+import multiprocessing
+import os
+import time
+
+import serial
+from pylsl import StreamInfo, StreamOutlet, local_clock
+
+import generate_random_lsl_stream
+import generate_random_lsl_stream_events
+import replay_nirs_to_lsl_stream
+from replay import MAX_SPEED_CHUNK_S, TICK_MS, ArraySource, ReplayStream, parse_speed
+from replay_hexoskin_to_lsl_stream import read_wav_source
+from serial_aggregator import SerialPort
+from tcp_listen_lsl_stream_events import EventServer, MAX_LINE_BYTES
+
+## Run many sources of LSL streams in one process: generators, replays, serial
+## ports, TCP and MIDI listeners, each as a task of one asyncio event loop.
+## Sources with "process": true run in a process pool instead, for the ones that
+## use a lot of CPU. The sources are in a JSON config, see source_host.example.json.
+##
+## poetry run python src/generate/source_host.py src/generate/source_host.example.json
+
+STATS_EVERY_S = 5
+RECONNECT_EVERY_S = 2
+
+
+class PeriodicSource():
+    """A source woken up every tick, on an absolute schedule, to return the samples due."""
+
+    def __init__(self, config, name: str):
+        self.config = config
+        self.name = config.get("name", name)
+        self.tick_s = config.get("tick_ms", TICK_MS) / 1000
+        self.outlet = None
+
+    async def open(self):
+        self.start = local_clock()
+        self.next_tick = self.start
+
+    async def wait_tick(self):
+        # the time spent pushing does not accumulate
+        self.next_tick += self.tick_s
+        await asyncio.sleep(max(0, self.next_tick - local_clock()))
+
+    def close(self):
+        self.outlet = None
+
+
+class RandomSource(PeriodicSource):
+    """Noisy sinusoids, as generate_random_lsl_stream."""
+
+    def __init__(self, config):
+        super().__init__(config, generate_random_lsl_stream.stream_name)
+
+    async def open(self):
+        config = self.config
+        self.stream = generate_random_lsl_stream.SinusoidStream(
+            self.name,
+            config.get("source_id", f"{generate_random_lsl_stream.source_id}_{self.name}"),
+            config.get("channels", len(generate_random_lsl_stream.frequencies)),
+            config.get("srate", generate_random_lsl_stream.sampling_rate),
+            config.get("frequencies", generate_random_lsl_stream.frequencies),
+            config.get("amplitude", generate_random_lsl_stream.amplitude),
+            config.get("noise_amplitude", generate_random_lsl_stream.noise_amplitude),
+        )
+        self.outlet = self.stream.outlet
+        await super().open()
+
+    async def next_chunk(self):
+        await self.wait_tick()
+        return self.stream.get_due(self.start, local_clock())
+
+
+class RandomEventsSource(PeriodicSource):
+    """The same event at a fixed period, as generate_random_lsl_stream_events."""
+
+    def __init__(self, config):
+        super().__init__(config, generate_random_lsl_stream_events.stream_name)
+        self.tick_s = config.get("period_s", generate_random_lsl_stream_events.SLEEP_TIME)
+
+    async def open(self):
+        info = StreamInfo(
+            self.name,
+            self.config.get("type", generate_random_lsl_stream_events.stream_type),
+            1, 0, 'string',
+            self.config.get("source_id", f"{generate_random_lsl_stream_events.source_id}_{self.name}"),
+        )
+        self.outlet = StreamOutlet(info)
+        await super().open()
+
+    async def next_chunk(self):
+        await self.wait_tick()
+        return [[self.config.get("event", generate_random_lsl_stream_events.event)]], local_clock()
+
+
+class ReplaySource(PeriodicSource):
+    """A record replayed in a loop at "speed" times real time, "max" for as fast as possible.
+
+    `create_stream(config, name)` opens the record, and returns its ReplayStream.
+    """
+
+    def __init__(self, config, name: str, create_stream):
+        super().__init__(config, name)
+        self.speed = parse_speed(str(config.get("speed", 1)))
+        self.create_stream = create_stream
+
+    async def open(self):
+        self.stream = self.create_stream(self.config, self.name)
+        self.outlet = self.stream.outlet
+        self.position = 0.0
+        await super().open()
+
+    async def next_chunk(self):
+        if math.isinf(self.speed):
+            # gives a turn to the other tasks
+            await asyncio.sleep(0)
+            self.position += MAX_SPEED_CHUNK_S
+        else:
+            await self.wait_tick()
+            self.position = (local_clock() - self.start) * self.speed
+        return self.stream.read_until(self.start, self.position)
+
+
+def create_wav_stream(config, name: str):
+    """WAV files of the same rate, one channel each, as replay_hexoskin_to_lsl_stream."""
+    srate, source = read_wav_source(config["paths"])
+    return ReplayStream(
+        name,
+        config.get("type", "Wav"),
+        srate,
+        source,
+        config.get("channel_format", 'int16'),
+        config.get("source_id", f"replay_{name}"),
+    )
+
+
+def create_nirs_stream(config, name: str):
+    """A NIRx record through the record cache, as replay_nirs_to_lsl_stream.
+
+    Decoding a record the first time takes long, and blocks the event loop:
+    such sources are better run with "process": true.
+    """
+    nirs = replay_nirs_to_lsl_stream
+    n_channels = config.get("channels", nirs.n_channels)
+    data, meta = nirs.read_cached_nirx(config.get("file", nirs.file_path), nirs.RecordCache())
+    return ReplayStream(
+        name,
+        config.get("type", nirs.stream_type),
+        meta["sfreq"],
+        ArraySource(list(data[:, :n_channels].T)),
+        'float32',
+        config.get("source_id", f"replay_{name}"),
+    )
+
+
+class WavReplaySource(ReplaySource):
+    def __init__(self, config):
+        super().__init__(config, "ReplayWav", create_wav_stream)
+
+
+class NirsReplaySource(ReplaySource):
+    def __init__(self, config):
+        super().__init__(config, replay_nirs_to_lsl_stream.stream_name, create_nirs_stream)
+
+
+class SerialSource():
+    """A serial port, with the same config as the ports of serial_aggregator."""
+
+    def __init__(self, config):
+        self.port = SerialPort(config)
+        self.name = self.port.outlet.get_info().name()
+        self.outlet = self.port.outlet
+        self.readable = asyncio.Event()
+
+    async def open(self):
+        # non blocking, reads are only done when the event loop reports data
+        self.port.serial = serial.Serial(self.port.port, self.port.baudrate, timeout=0)
+        asyncio.get_running_loop().add_reader(self.port.serial.fileno(), self.readable.set)
+
+    async def next_chunk(self):
+        await self.readable.wait()
+        self.readable.clear()
+        return self.port.read_chunk()
+
+    def close(self):
+        if self.port.serial is not None:
+            asyncio.get_running_loop().remove_reader(self.port.serial.fileno())
+            self.port.close()
+
+
+class TcpSource(EventServer):
+    """Lines received from TCP clients, as tcp_listen_lsl_stream_events."""
+
+    def __init__(self, config):
+        self.host = config.get("host", "0.0.0.0")
+        self.port = config.get("port", 8000)
+        self.name = config.get("name", f"TcpListenStrStream_{self.port}")
+        info = StreamInfo(self.name, config.get("type", "TcpListenStr"), 1, 0, 'string', f'tcp_listen_{self.port}')
+        super().__init__(StreamOutlet(info))
+        self.ready = asyncio.Event()
+        self.server = None
+
+    async def open(self):
+        self.server = await asyncio.start_server(self.handle_client, self.host, self.port, limit=MAX_LINE_BYTES)
+
+    def flush(self):
+        # the events are returned by next_chunk instead of pushed here
+        self.flush_scheduled = False
+        self.ready.set()
+
+    async def next_chunk(self):
+        await self.ready.wait()
+        self.ready.clear()
+        events, timestamps = self.pending_events, self.pending_timestamps
+        self.pending_events = []
+        self.pending_timestamps = []
+        return events, timestamps
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+            self.server = None
+
+
+class MidiSource():
+    """The notes of a MIDI input, recorded in MIDI files, as midi_recorder_lsl_events."""
+
+    def __init__(self, config):
+        # rtmidi is only needed, and only has to be installed, for MIDI sources
+        import midi_recorder_lsl_events
+        self.midi = midi_recorder_lsl_events
+        self.config = config
+        self.name = config.get("name", self.midi.notes_stream_name)
+        self.outlet = self.midi.create_notes_outlet(self.name, config.get("source_id", f"piano_{self.name}"))
+        self.queue = asyncio.Queue()
+        self.midi_in = None
+
+        # kept across reconnections, so that the numbering of the MIDI files goes on
+        self.recorder = self.midi.MidiRecorder(
+            self.outlet,
+            file_prefix=config.get("output", self.midi.file_prefix),
+            segment_s=config.get("segment_s", self.midi.SEGMENT_S),
+        )
+
+    async def open(self):
+        # the deltas of rtmidi start over with the port, timestamps are anchored again
+        self.recorder.timestamp = None
+        loop = asyncio.get_running_loop()
+
+        def midi_in_callback(event, data=None):
+            # runs in the thread of rtmidi, nothing else is done here
+            loop.call_soon_threadsafe(self.queue.put_nowait, event)
+
+        self.midi_in = self.midi.open_midiinput(self.config.get("port", self.midi.midi_port), client_name='source_host', interactive=False)[0]
+        self.midi_in.set_callback(midi_in_callback)
+
+    async def next_chunk(self):
+        events = [await self.queue.get()]
+        while not self.queue.empty():
+            events.append(self.queue.get_nowait())
+        chunk = self.recorder.get_chunk(events)
+        self.recorder.save_segment_if_due()
+        return chunk
+
+    def close(self):
+        if self.midi_in is not None:
+            self.midi_in.close_port()
+            self.midi_in = None
+        self.recorder.save_segment()
+
+
+SOURCES = {
+    "random": RandomSource,
+    "random_events": RandomEventsSource,
+    "replay_wav": WavReplaySource,
+    "replay_nirs": NirsReplaySource,
+    "serial": SerialSource,
+    "tcp": TcpSource,
+    "midi": MidiSource,
+}
+
+
+def create_source(config):
+    """A source has `name`, `outlet`, `open()`, `next_chunk()` and `close()`.
+
+    open and next_chunk are coroutines. next_chunk waits for the next chunk,
+    and returns (chunk, timestamps) as passed to push_chunk, the chunk can
+    be empty.
+    """
+    if config["source"] not in SOURCES:
+        raise ValueError(f"Unknown source {config['source']}, available: {', '.join(SOURCES)}")
+    return SOURCES[config["source"]](config)
+
+
+class SourceHost():
+    """Run sources as tasks of the event loop, and push their chunks.
+
+    A source that fails is closed then opened again, every RECONNECT_EVERY_S,
+    without stopping the others.
+    """
+
+    def __init__(self, configs):
+        self.process_configs = [config for config in configs if config.get("process", False)]
+        self.sources = [create_source(config) for config in configs if not config.get("process", False)]
+
+        self.values = {source: 0 for source in self.sources}
+        self.errors = {source: 0 for source in self.sources}
+        self.opened = {source: False for source in self.sources}
+
+    async def run_source(self, source):
+        last_error = None
+        while True:
+            try:
+                await source.open()
+                self.opened[source] = True
+                print(f"Source {source.name} opened")
+                last_error = None
+
+                while True:
+                    chunk, timestamps = await source.next_chunk()
+                    if len(chunk) > 0:
+                        source.outlet.push_chunk(chunk, timestamps)
+                        self.values[source] += len(chunk)
+
+            except Exception as e:
+                # printed once, not on every retry
+                if str(e) != last_error:
+                    print(f"Source {source.name} failed: {e}")
+                    last_error = str(e)
+                self.errors[source] += 1
+            finally:
+                self.opened[source] = False
+                source.close()
+
+            await asyncio.sleep(RECONNECT_EVERY_S)
+
+    async def print_stats(self):
+        previous = {source: 0 for source in self.sources}
+        last_stats = time.perf_counter()
+        while True:
+            await asyncio.sleep(STATS_EVERY_S)
+            now = time.perf_counter()
+            print(f"Sources of process {os.getpid()}")
+            for source in self.sources:
+                print(
+                    f"  {source.name:30s} {'open' if self.opened[source] else 'closed':6s}"
+                    f"   {(self.values[source] - previous[source]) / (now - last_stats):10.1f} values/s"
+                    f"   errors {self.errors[source]}"
+                )
+                previous[source] = self.values[source]
+            last_stats = now
+
+    async def run(self):
+        tasks = [asyncio.create_task(self.run_source(source)) for source in self.sources]
+        if len(self.sources) > 0:
+            tasks.append(asyncio.create_task(self.print_stats()))
+
+        if len(self.process_configs) == 0:
+            await asyncio.gather(*tasks)
+            return
+
+        # each of these sources keeps a process of the pool for itself, spawned
+        # and not forked, so that the threads of liblsl are not copied
+        loop = asyncio.get_running_loop()
+        context = multiprocessing.get_context("spawn")
+        with concurrent.futures.ProcessPoolExecutor(max_workers=len(self.process_configs), mp_context=context) as executor:
+            for config in self.process_configs:
+                tasks.append(loop.run_in_executor(executor, run_in_process, config))
+            await asyncio.gather(*tasks)
+
+
+def run_in_process(config):
+    """Run a source in a host of its own, in a process of the pool."""
+    try:
+        asyncio.run(SourceHost([dict(config, process=False)]).run())
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run many sources of LSL streams from a single process.")
+    parser.add_argument("config", help="JSON file with a list of sources")
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        config = json.load(f)
+
+    try:
+        asyncio.run(SourceHost(config["sources"]).run())
+    except KeyboardInterrupt:
+        print("Streaming stopped.")
+
+
+if __name__ == "__main__":
+    main()
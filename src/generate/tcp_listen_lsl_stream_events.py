@@ -1,7 +1,9 @@
-import socket
+import argparse
+import asyncio
+
 from pylsl import StreamInfo, StreamOutlet, local_clock
 
-# NOTE: this will handle only ONE client at a time
+# Each line received is an event, from any number of clients at the same time.
 # You can use it with netcat:
 #    nc localhost 8000 -v
 # or
@@ -13,35 +15,101 @@ stream_type = "TcpListenStr"
 host = "0.0.0.0"
 port = 8000
 
-info = StreamInfo(stream_name, stream_type, 1, 0, 'string', f'tcp_listen_{port}')
-outlet = StreamOutlet(info)
+# longer lines are dropped
+MAX_LINE_BYTES = 64 * 1024
+
+
+class EventServer():
+    """Push the lines received from TCP clients as events.
+
+    Events are stamped when their line is read. All the lines read during
+    an iteration of the event loop, from all the clients, are pushed with
+    a single push_chunk.
+    """
 
-def handle_packet(data):
-    msg = data.decode('utf-8').strip()
-    outlet.push_sample([msg], local_clock())
+    def __init__(self, outlet: StreamOutlet):
+        self.outlet = outlet
+        self.pending_timestamps = []
+        self.pending_events = []
+        self.flush_scheduled = False
 
-print(f"Opening TCP {host}:{port}...")
-server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-server_socket.bind((host, port))
-server_socket.listen()
-print(f"Listening on TCP {host}:{port}...")
+    def add_event(self, line: bytes):
+        timestamp = local_clock()
+        event = line.decode("utf-8", errors="replace").strip()
+        if event == "":
+            return
 
-try:
-    while True:
-        # Accept a new connection
-        connection, address = server_socket.accept()
+        self.pending_timestamps.append(timestamp)
+        self.pending_events.append([event])
+        if not self.flush_scheduled:
+            # runs after the callbacks already ready, so a burst is pushed at once
+            asyncio.get_running_loop().call_soon(self.flush)
+            self.flush_scheduled = True
+
+    def flush(self):
+        self.flush_scheduled = False
+        if len(self.pending_events) == 0:
+            return
+        self.outlet.push_chunk(self.pending_events, self.pending_timestamps)
+        self.pending_timestamps = []
+        self.pending_events = []
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        address = writer.get_extra_info("peername")
         print(f"Connection established with {address}")
-        
+        count = 0
+        # in the middle of a line that is too long
+        dropping = False
+
         try:
-            # Receive data in chunks and handle each packet
             while True:
-                data = connection.recv(1024)  # Adjust the size as necessary
-                if not data:
-                    # No data received, client closed the connection
+                try:
+                    line = await reader.readuntil(b"\n")
+                except asyncio.IncompleteReadError as e:
+                    # the client closed the connection, maybe after a last line without newline
+                    self.add_event(e.partial)
                     break
-                handle_packet(data)  # Call the function to process the packet
+                except asyncio.LimitOverrunError as e:
+                    if not dropping:
+                        print(f"Line longer than {MAX_LINE_BYTES} bytes from {address}, dropped")
+                    await reader.readexactly(e.consumed)
+                    dropping = True
+                    continue
+
+                if dropping:
+                    dropping = False
+                    continue
+                self.add_event(line)
+                count += 1
+        except ConnectionError as e:
+            print(f"Connection with {address} lost: {e}")
         finally:
-            connection.close()  # Always close the connection when done
-except:
-    print("External try-except")
-    server_socket.close()
\ No newline at end of file
+            writer.close()
+            print(f"Connection closed with {address}, {count} events received")
+
+
+async def serve(host: str, port: int):
+    info = StreamInfo(stream_name, stream_type, 1, 0, 'string', f'tcp_listen_{port}')
+    event_server = EventServer(StreamOutlet(info))
+
+    print(f"Opening TCP {host}:{port}...")
+    server = await asyncio.start_server(event_server.handle_client, host, port, limit=MAX_LINE_BYTES)
+    print(f"Listening on TCP {host}:{port}...")
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Push the lines received on a TCP port as LSL events.")
+    parser.add_argument("--host", default=host)
+    parser.add_argument("--port", type=int, default=port)
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print("Streaming stopped.")
+
+
+if __name__ == "__main__":
+    main()
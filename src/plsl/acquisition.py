@@ -0,0 +1,154 @@
+import threading
+import time
+
+import numpy as np
+from pylsl import StreamInlet, local_clock
+# pylsl raises its own classes, which are not the builtin TimeoutError
+from pylsl.util import LostError, TimeoutError as LslTimeoutError
+
+from decimation import MinMaxDecimator
+from events import EventBuffer
+from ring_buffer import RingBuffer
+
+TIME_CORRECTION_EVERY_S = 5
+TIME_CORRECTION_TIMEOUT_S = 1
+# stop() is waited for at most this long while the source does not answer
+OPEN_STREAM_TIMEOUT_S = 0.5
+
+
+class AcquisitionStats():
+    """Counters of a StreamAcquisition, written by its thread and read by the HUD."""
+
+    def __init__(self):
+        self.samples = 0
+        self.chunks = 0
+        self.max_chunk_size = 0
+        self.last_timestamp = None
+        # seconds from the last sample of a chunk to when it was pulled, on the local clock
+        self.latency = None
+        self.time_correction = 0.0
+        # samples waiting in the inlet when a pull starts
+        self.backlog = 0
+        # seconds spent pulling
+        self.pull_time = 0.0
+
+    def add_chunk(self, timestamps, time_correction: float):
+        self.samples += len(timestamps)
+        self.chunks += 1
+        self.max_chunk_size = max(self.max_chunk_size, len(timestamps))
+        self.last_timestamp = timestamps[-1]
+        self.latency = local_clock() - (timestamps[-1] + time_correction)
+
+
+class StreamAcquisition(threading.Thread):
+    """Drain a StreamInlet into a RingBuffer on its own thread.
+
+    Numeric streams are pulled directly into a preallocated (samples x channels)
+    array of `dtype`. Streams without a numeric dtype are event streams: their
+    samples are stored in `events` instead, with the channels joined as label.
+
+    When a `decimator` is given, its min/max envelope is updated with every
+    chunk written to the buffer.
+
+    Unless the inlet already has `corrected_timestamps` (proc_clocksync), the
+    clock offset of the source is refreshed every TIME_CORRECTION_EVERY_S in
+    `stats`.
+    """
+
+    def __init__(self, lsl_inlet: StreamInlet, every_ms: float, max_chunk_samples: int, buffer: RingBuffer = None, dtype=None, decimator: MinMaxDecimator = None, events: EventBuffer = None, corrected_timestamps: bool = False):
+        super().__init__(daemon=True)
+        self.lsl_inlet = lsl_inlet
+        self.corrected_timestamps = corrected_timestamps
+        self.stats = AcquisitionStats()
+        self.buffer = buffer
+        self.decimator = decimator
+        self.events = events
+        self.every_ms = every_ms
+        self.max_chunk_samples = max_chunk_samples
+        self.stop_event = threading.Event()
+
+        self.has_srate = dtype is not None
+        if self.has_srate:
+            self.pull_buffer = np.zeros((max_chunk_samples, buffer.channel_count), dtype=dtype)
+
+    def open_stream(self):
+        """Wait for the source, until it answers or the acquisition is stopped.
+
+        Without it, the first pull would open the stream and wait forever
+        for a source that went away.
+        """
+        while not self.stop_event.is_set():
+            try:
+                self.lsl_inlet.open_stream(timeout=OPEN_STREAM_TIMEOUT_S)
+                return True
+            except LslTimeoutError:
+                pass
+            except LostError:
+                print("Stream lost, acquisition stopped")
+                return False
+        return False
+
+    def run(self):
+        if not self.open_stream():
+            return
+
+        last_time_correction = None
+        while not self.stop_event.wait(self.every_ms / 1000):
+            start = time.perf_counter()
+            try:
+                self.stats.backlog = self.lsl_inlet.samples_available()
+                if self.has_srate:
+                    self.pull_samples()
+                else:
+                    self.pull_events()
+            except LostError:
+                # the source will not come back on this inlet, discovery reports it as lost
+                print("Stream lost, acquisition stopped")
+                return
+            self.stats.pull_time += time.perf_counter() - start
+
+            if not self.corrected_timestamps and (last_time_correction is None or start - last_time_correction > TIME_CORRECTION_EVERY_S):
+                last_time_correction = start
+                self.update_time_correction()
+
+    def update_time_correction(self):
+        # only the first call waits for the source, liblsl then keeps it up to date in the background
+        try:
+            self.stats.time_correction = self.lsl_inlet.time_correction(timeout=TIME_CORRECTION_TIMEOUT_S)
+        except (LslTimeoutError, LostError):
+            # tried again at the next refresh, samples keep being pulled meanwhile
+            pass
+
+    def get_time_correction(self):
+        # corrected timestamps are already on the local clock
+        return 0.0 if self.corrected_timestamps else self.stats.time_correction
+
+    def stop(self):
+        self.stop_event.set()
+
+    def write(self, chunk: np.ndarray):
+        self.buffer.append(chunk)
+        if self.decimator is not None:
+            self.decimator.append(chunk)
+
+    def pull_samples(self):
+        # read all there is, liblsl writes directly in the preallocated (samples x channels) array
+        while True:
+            _, timestamps = self.lsl_inlet.pull_chunk(timeout=0.0, max_samples=self.max_chunk_samples, dest_obj=self.pull_buffer) # have a 0.0 timeout to avoid blocking here
+            n_samples = len(timestamps)
+            if n_samples == 0:
+                break # exit while True loop
+
+            # transposed view, each row is a channel
+            self.write(self.pull_buffer[:n_samples].T)
+            self.stats.add_chunk(timestamps, self.get_time_correction())
+
+    def pull_events(self):
+        # read all there is
+        while True:
+            chunk, timestamps = self.lsl_inlet.pull_chunk(timeout=0.0) # have a 0.0 timeout to avoid blocking here
+            if len(chunk) == 0:
+                break # exit while True loop
+
+            self.events.append(timestamps, [", ".join(sample) for sample in chunk])
+            self.stats.add_chunk(timestamps, self.get_time_correction())
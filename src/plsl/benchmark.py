@@ -0,0 +1,280 @@
+import argparse
+import datetime
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import threading
+import time
+
+import numpy as np
+
+## Headless benchmark of the GUI ingest/render pipeline. Each configuration of the
+## grid runs in its own process, against synthetic outlets created in that process.
+##
+## poetry run python src/plsl/benchmark.py --streams 1,4 --channels 8,64 --srates 250,1000 --output bench.json
+## poetry run python src/plsl/benchmark.py --mode headless --compare bench.json
+
+PUSH_EVERY_MS = 10
+WARMUP_S = 2
+
+
+class SyntheticOutlet(threading.Thread):
+    """Push noise on a StreamOutlet at a fixed rate, from an absolute schedule."""
+
+    def __init__(self, name: str, channel_count: int, srate: float):
+        super().__init__(daemon=True)
+        from pylsl import StreamInfo, StreamOutlet
+
+        self.info = StreamInfo(name, "Benchmark", channel_count, srate, "float32", name)
+        self.outlet = StreamOutlet(self.info)
+        self.srate = srate
+        self.pushed = 0
+        self.stop_event = threading.Event()
+
+        # pushed in slices, generating noise is not what is measured
+        self.noise = np.random.default_rng().normal(size=(int(srate), channel_count)).astype(np.float32)
+
+    def run(self):
+        start = time.perf_counter()
+        while not self.stop_event.wait(PUSH_EVERY_MS / 1000):
+            n_samples = int((time.perf_counter() - start) * self.srate) - self.pushed
+            while n_samples > 0:
+                n_chunk = min(n_samples, len(self.noise))
+                self.outlet.push_chunk(self.noise[:n_chunk])
+                self.pushed += n_chunk
+                n_samples -= n_chunk
+
+    def stop(self):
+        self.stop_event.set()
+
+
+def resolve_outlets(outlets):
+    from pylsl import resolve_byprop
+
+    lsl_streams = []
+    for outlet in outlets:
+        found = resolve_byprop("source_id", outlet.info.source_id(), timeout=5)
+        if len(found) == 0:
+            raise RuntimeError(f"Benchmark outlet {outlet.info.name()} not found")
+        lsl_streams.append(found[0])
+    return lsl_streams
+
+
+def run_gui(lsl_streams, duration: float):
+    """Drive MainWindow.update_plot from its own timer, on the offscreen Qt platform."""
+    from PySide6.QtWidgets import QApplication
+    from PySide6.QtCore import QTimer
+    import gui
+
+    app = QApplication([])
+    window = gui.MainWindow(discover=False)
+    window.resize(1920, 1080)
+    for lsl_stream in lsl_streams:
+        window.add_stream(lsl_stream)
+    window.show()
+
+    frame_times = []
+
+    def timed_update_plot():
+        start = time.perf_counter()
+        window.update_plot()
+        frame_times.append(time.perf_counter() - start)
+
+    window.timer.timeout.disconnect()
+    window.timer.timeout.connect(timed_update_plot)
+
+    # frames of the warmup are not counted
+    QTimer.singleShot(WARMUP_S * 1000, frame_times.clear)
+    QTimer.singleShot(int((WARMUP_S + duration) * 1000), app.quit)
+
+    start = {}
+
+    def end_warmup():
+        start["samples"] = sum(stream.acquisition.stats.samples for stream in window.streams)
+        start["time"] = time.perf_counter()
+
+    QTimer.singleShot(WARMUP_S * 1000, end_warmup)
+    app.exec()
+
+    samples = sum(stream.acquisition.stats.samples for stream in window.streams) - start["samples"]
+    elapsed = time.perf_counter() - start["time"]
+    window.close()
+    return frame_times, samples / elapsed
+
+
+def run_headless(lsl_streams, duration: float):
+    """Same acquisition and compute steps as the GUI, without any widget."""
+    from pylsl import StreamInlet
+    from acquisition import StreamAcquisition
+    from decimation import MinMaxDecimator
+    from ring_buffer import RingBuffer
+    from spectrum import SpectralEngine
+    import gui
+
+    pipelines = []
+    for lsl_stream in lsl_streams:
+        fs = lsl_stream.nominal_srate()
+        buffer_size = int(fs * gui.BUFFER_DURATION_MS / 1000)
+        buffer = RingBuffer(lsl_stream.channel_count(), buffer_size)
+        decimator = MinMaxDecimator(lsl_stream.channel_count(), buffer_size, 1920)
+        segment_length = min(buffer_size, int(fs * gui.FFT_SEGMENT_MS / 1000))
+        spectrum = SpectralEngine(fs, segment_length, overlap=gui.FFT_OVERLAP, every_ms=gui.FFT_EVERY_MS)
+        acquisition = StreamAcquisition(
+            StreamInlet(lsl_stream),
+            every_ms=gui.ACQUIRE_EVERY_MS,
+            max_chunk_samples=gui.MAX_CHUNK_SAMPLES,
+            buffer=buffer,
+            dtype=gui.LSL_FORMAT_DTYPES[lsl_stream.channel_format()],
+            decimator=decimator,
+        )
+        acquisition.start()
+        pipelines.append((buffer, decimator, spectrum, acquisition))
+
+    frame_times = []
+    start_samples = None
+    start = time.perf_counter()
+    next_frame = start
+    while True:
+        next_frame += gui.REFRESH_EVERY_MS / 1000
+        time.sleep(max(0, next_frame - time.perf_counter()))
+
+        now = time.perf_counter()
+        if now - start > WARMUP_S + duration:
+            break
+        if start_samples is None and now - start > WARMUP_S:
+            start_samples = sum(acquisition.stats.samples for *_, acquisition in pipelines)
+            start_measure = now
+            frame_times.clear()
+
+        for buffer, decimator, spectrum, _ in pipelines:
+            decimator.snapshot()
+            if spectrum.is_due(now):
+                data, _ = buffer.snapshot()
+                spectrum.welch(data)
+        frame_times.append(time.perf_counter() - now)
+
+    samples = sum(acquisition.stats.samples for *_, acquisition in pipelines) - start_samples
+    elapsed = time.perf_counter() - start_measure
+    for *_, acquisition in pipelines:
+        acquisition.stop()
+        acquisition.join()
+    return frame_times, samples / elapsed
+
+
+def run_config(config, queue):
+    # Qt has to know the platform before the application is created
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+    outlets = []
+    for i in range(config["streams"]):
+        outlets.append(SyntheticOutlet(f"Benchmark{i}_{os.getpid()}", config["channels"], config["srate"]))
+    for outlet in outlets:
+        outlet.start()
+    lsl_streams = resolve_outlets(outlets)
+
+    start_pushed = sum(outlet.pushed for outlet in outlets)
+    start = time.perf_counter()
+    if config["mode"] == "gui":
+        frame_times, samples_per_s = run_gui(lsl_streams, config["duration"])
+    else:
+        frame_times, samples_per_s = run_headless(lsl_streams, config["duration"])
+    pushed_per_s = (sum(outlet.pushed for outlet in outlets) - start_pushed) / (time.perf_counter() - start)
+
+    for outlet in outlets:
+        outlet.stop()
+
+    frame_times = np.array(frame_times) * 1000
+    queue.put({
+        **config,
+        "frames": len(frame_times),
+        # a sample holds a value for each channel
+        "samples_per_s": samples_per_s,
+        "values_per_s": samples_per_s * config["channels"],
+        # includes the warmup, to check that the outlets kept up
+        "pushed_samples_per_s": pushed_per_s,
+        "frame_ms_p50": float(np.percentile(frame_times, 50)) if len(frame_times) else None,
+        "frame_ms_p99": float(np.percentile(frame_times, 99)) if len(frame_times) else None,
+        # kilobytes on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    })
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def config_key(result):
+    return (result["mode"], result["streams"], result["channels"], result["srate"])
+
+
+def print_result(result, previous=None):
+    line = (
+        f"{result['mode']:8s} {result['streams']:3d} streams x {result['channels']:4d} ch @ {result['srate']:7.0f} Hz"
+        f"   {result['samples_per_s']:11.0f} samples/s"
+        f"   frame p50 {result['frame_ms_p50']:7.2f} ms p99 {result['frame_ms_p99']:7.2f} ms"
+        f"   rss {result['peak_rss_mb']:7.1f} MB"
+    )
+    if previous is not None:
+        line += f"   (p99 was {previous['frame_ms_p99']:.2f} ms, rss was {previous['peak_rss_mb']:.1f} MB)"
+    print(line, flush=True)
+
+
+def parse_list(text: str, cast):
+    return [cast(x) for x in text.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the GUI ingest/render pipeline against synthetic LSL streams.")
+    parser.add_argument("--mode", choices=["gui", "headless"], default="gui", help="gui drives MainWindow.update_plot offscreen, headless only the ingest and compute steps")
+    parser.add_argument("--streams", default="1,4", help="comma separated numbers of streams")
+    parser.add_argument("--channels", default="8,64", help="comma separated numbers of channels per stream")
+    parser.add_argument("--srates", default="250,1000", help="comma separated sample rates")
+    parser.add_argument("--duration", type=float, default=10, help="measured seconds per configuration, after a warmup")
+    parser.add_argument("--output", help="JSON file where the results are saved")
+    parser.add_argument("--compare", help="JSON file of a previous run to compare with")
+    args = parser.parse_args()
+
+    previous = {}
+    if args.compare:
+        with open(args.compare) as f:
+            previous = {config_key(result): result for result in json.load(f)["results"]}
+
+    # a fresh process per configuration, for a clean Qt state and a meaningful peak RSS
+    context = multiprocessing.get_context("spawn")
+    results = []
+    grid = itertools.product(parse_list(args.streams, int), parse_list(args.channels, int), parse_list(args.srates, float))
+    for streams, channels, srate in grid:
+        config = {"mode": args.mode, "streams": streams, "channels": channels, "srate": srate, "duration": args.duration}
+        queue = context.Queue()
+        process = context.Process(target=run_config, args=(config, queue))
+        process.start()
+        process.join()
+        if process.exitcode != 0:
+            print(f"Configuration {config} failed")
+            continue
+
+        result = queue.get()
+        results.append(result)
+        print_result(result, previous.get(config_key(result)))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "commit": get_commit(),
+                "date": datetime.datetime.now().isoformat(timespec="seconds"),
+                "platform": platform.platform(),
+                "python": platform.python_version(),
+                "results": results,
+            }, f, indent=2)
+        print(f"Results saved in {args.output}")
+
+
+if __name__ == "__main__":
+    main()
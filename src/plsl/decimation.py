@@ -0,0 +1,74 @@
+import threading
+
+import numpy as np
+
+from ring_buffer import RingBuffer
+
+
+class MinMaxDecimator():
+    """Min/max envelope of the last `capacity` samples of a (channels x samples) signal.
+
+    Every `bucket_size` samples are reduced to one (min, max) pair, with
+    `bucket_size` chosen so there are at most `columns` pairs, usually the
+    pixel width of the plot. The envelope is updated as chunks arrive: only
+    the new samples are reduced, never the whole buffer.
+    """
+
+    def __init__(self, channel_count: int, capacity: int, columns: int):
+        self.channel_count = channel_count
+        self.bucket_size = max(1, int(np.ceil(capacity / columns)))
+        self.n_buckets = capacity // self.bucket_size
+
+        self.mins = RingBuffer(channel_count, self.n_buckets)
+        self.maxs = RingBuffer(channel_count, self.n_buckets)
+
+        # samples of the bucket being filled
+        self.partial = np.zeros((channel_count, self.bucket_size))
+        self.partial_count = 0
+
+        self.lock = threading.Lock()
+
+    def append(self, chunk: np.ndarray):
+        n = chunk.shape[1]
+        if n == 0:
+            return
+
+        with self.lock:
+            start = 0
+
+            # complete the pending bucket first
+            if self.partial_count > 0:
+                start = min(n, self.bucket_size - self.partial_count)
+                self.partial[:, self.partial_count:self.partial_count + start] = chunk[:, :start]
+                self.partial_count += start
+                if self.partial_count < self.bucket_size:
+                    return
+                self.mins.append(self.partial.min(axis=1, keepdims=True))
+                self.maxs.append(self.partial.max(axis=1, keepdims=True))
+                self.partial_count = 0
+
+            # reduce all the complete buckets in one pass
+            n_full = (n - start) // self.bucket_size
+            if n_full > 0:
+                end = start + n_full * self.bucket_size
+                buckets = chunk[:, start:end].reshape(self.channel_count, n_full, self.bucket_size)
+                self.mins.append(buckets.min(axis=2))
+                self.maxs.append(buckets.max(axis=2))
+                start = end
+
+            # keep the rest for the next chunk
+            rest = n - start
+            if rest > 0:
+                self.partial[:, :rest] = chunk[:, start:]
+                self.partial_count = rest
+
+    def snapshot(self):
+        """(channels x 2*n_buckets) copy, min and max of each bucket interleaved."""
+        with self.lock:
+            mins, _ = self.mins.snapshot()
+            maxs, _ = self.maxs.snapshot()
+
+        envelope = np.empty((self.channel_count, 2 * self.n_buckets))
+        envelope[:, 0::2] = mins
+        envelope[:, 1::2] = maxs
+        return envelope
@@ -0,0 +1,52 @@
+import queue
+import threading
+
+from pylsl import ContinuousResolver, StreamInfo
+
+
+def get_stream_key(lsl_stream: StreamInfo):
+    # A stream restarted by its source keeps its source_id but gets a new uid.
+    # Scripts often hard-code their source_id, the hostname tells apart the same script on two machines.
+    if lsl_stream.source_id() == "":
+        return lsl_stream.uid()
+    return f"{lsl_stream.hostname()}/{lsl_stream.source_id()}/{lsl_stream.name()}/{lsl_stream.type()}"
+
+
+class StreamDiscovery(threading.Thread):
+    """Watch the LSL streams of the network with a ContinuousResolver.
+
+    The resolver runs in the background, this thread only compares its
+    results every `every_ms` and puts ("added", info) and ("lost", info)
+    tuples in `changes`, to be consumed by the Qt thread.
+    """
+
+    def __init__(self, every_ms: float, forget_after: float):
+        super().__init__(daemon=True)
+        self.every_ms = every_ms
+        self.resolver = ContinuousResolver(forget_after=forget_after)
+        self.changes = queue.Queue()
+        self.stop_event = threading.Event()
+
+    def run(self):
+        known = {}
+        while not self.stop_event.wait(self.every_ms / 1000):
+            current = {lsl_stream.uid(): lsl_stream for lsl_stream in self.resolver.results()}
+
+            for uid in current.keys() - known.keys():
+                self.changes.put(("added", current[uid]))
+
+            for uid in known.keys() - current.keys():
+                self.changes.put(("lost", known[uid]))
+
+            known = current
+
+    def stop(self):
+        self.stop_event.set()
+
+    def get_changes(self):
+        changes = []
+        while True:
+            try:
+                changes.append(self.changes.get_nowait())
+            except queue.Empty:
+                return changes
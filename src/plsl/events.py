@@ -0,0 +1,86 @@
+import threading
+
+import numpy as np
+
+
+class EventBuffer():
+    """Events of a marker stream, stored as sorted (timestamp, label id) arrays.
+
+    Labels are stored once and referenced by id. Memory and query cost depend
+    on the number of events, not on the elapsed time. Events older than
+    `keep_duration` seconds are dropped when the arrays are full, and the
+    labels only they used with them.
+    """
+
+    def __init__(self, keep_duration: float, capacity: int = 256):
+        self.keep_duration = keep_duration
+        self.timestamps = np.zeros(capacity)
+        self.label_ids = np.zeros(capacity, dtype=np.int32)
+        self.count = 0
+        self.total_written = 0
+
+        self.labels = []
+        self.label_id_by_label = {}
+
+        self.lock = threading.Lock()
+
+    def get_label_id(self, label: str):
+        label_id = self.label_id_by_label.get(label)
+        if label_id is None:
+            label_id = len(self.labels)
+            self.labels.append(label)
+            self.label_id_by_label[label] = label_id
+        return label_id
+
+    def append(self, timestamps, labels):
+        n = len(timestamps)
+        if n == 0:
+            return
+
+        with self.lock:
+            if self.count + n > len(self.timestamps):
+                self.make_room(n, timestamps[-1])
+
+            # after make_room, which renumbers the labels
+            label_ids = [self.get_label_id(label) for label in labels]
+
+            start = self.count
+            self.timestamps[start:start + n] = timestamps
+            self.label_ids[start:start + n] = label_ids
+            self.count += n
+            self.total_written += n
+
+            # events are almost always received in order, sort only when needed
+            if start > 0 and self.timestamps[start] < self.timestamps[start - 1]:
+                order = np.argsort(self.timestamps[:self.count], kind="stable")
+                self.timestamps[:self.count] = self.timestamps[order]
+                self.label_ids[:self.count] = self.label_ids[order]
+
+    def make_room(self, n: int, latest: float):
+        # drop what is too old to be displayed, then grow if still needed
+        first = np.searchsorted(self.timestamps[:self.count], latest - self.keep_duration)
+        kept = self.count - first
+        self.timestamps[:kept] = self.timestamps[first:self.count]
+        self.label_ids[:kept] = self.label_ids[first:self.count]
+        self.count = kept
+
+        # with unique labels, such as trial numbers, the table would grow with every event
+        used, self.label_ids[:kept] = np.unique(self.label_ids[:kept], return_inverse=True)
+        self.labels = [self.labels[label_id] for label_id in used]
+        self.label_id_by_label = {label: label_id for label_id, label in enumerate(self.labels)}
+
+        capacity = len(self.timestamps)
+        while self.count + n > capacity:
+            capacity *= 2
+        if capacity > len(self.timestamps):
+            self.timestamps = np.resize(self.timestamps, capacity)
+            self.label_ids = np.resize(self.label_ids, capacity)
+
+    def query(self, t0: float, t1: float):
+        """Copy of the timestamps, and the labels, of the events with t0 <= timestamp < t1."""
+        with self.lock:
+            timestamps = self.timestamps[:self.count]
+            first, last = np.searchsorted(timestamps, [t0, t1])
+            # label ids are only valid until the next make_room
+            labels = [self.labels[label_id] for label_id in self.label_ids[first:last]]
+            return timestamps[first:last].copy(), labels
@@ -1,13 +1,21 @@
-from typing import List
-import sys
+from typing import Dict, List
 import os
 import signal
+import time
 import numpy as np
 import pyqtgraph as pg
-from PySide6.QtWidgets import QApplication, QMainWindow, QWidget, QVBoxLayout, QSplitter, QLabel, QTabWidget, QPushButton, QFrame
-from PySide6.QtCore import QTimer, Qt
+from PySide6.QtWidgets import QApplication, QMainWindow, QWidget, QVBoxLayout, QSplitter, QTabWidget, QPushButton, QFrame, QScrollArea
+from PySide6.QtCore import QTimer, Qt, QPoint, QRect
 from PySide6.QtGui import QScreen
-from pylsl import resolve_streams, StreamInlet, StreamInfo, local_clock
+from pylsl import StreamInlet, StreamInfo, local_clock, proc_clocksync
+
+from acquisition import StreamAcquisition
+from decimation import MinMaxDecimator
+from discovery import StreamDiscovery, get_stream_key
+from events import EventBuffer
+from hud import FrameStats, PerformanceHud
+from ring_buffer import RingBuffer
+from spectrum import SpectralEngine
 
 ## Can be run like this. Note that signal.SIGHUP is necessary to kill the window application
 ## In one terminal
@@ -15,9 +23,46 @@ from pylsl import resolve_streams, StreamInlet, StreamInfo, local_clock
 ## In another terminal
 # yes | while read i; do python src/plsl/gui.py; done
 
+# Render rate of the Qt timer, the inlets are drained on their own threads every ACQUIRE_EVERY_MS
 REFRESH_EVERY_MS = 20
+ACQUIRE_EVERY_MS = 5
 BUFFER_DURATION_MS = 5000
-PSEUDO_SRATE_FOR_EVENTS = 1000
+CHANNEL_MIN_HEIGHT = 200
+
+# The network is watched in the background, a stream is lost when not seen for DISCOVERY_FORGET_AFTER_MS.
+# liblsl queries the network about every 0.5 s, so a stream still there is seen a few times in between.
+DISCOVERY_EVERY_MS = 500
+DISCOVERY_FORGET_AFTER_MS = 2000
+
+# Refresh rate of the "Info" tab
+HUD_EVERY_MS = 1000
+
+# Streams with at least this many channels are drawn in a single stacked plot
+STACKED_VIEW_MIN_CHANNELS = 8
+STACKED_CHANNEL_HEIGHT = 20
+
+# Needs PyOpenGL, curves are then drawn by the GPU
+USE_OPENGL = False
+SRATE_FOR_IRREGULAR_STREAMS = 1000
+MAX_CHUNK_SAMPLES = 1024
+
+# The spectrum is refreshed at its own rate, independently of REFRESH_EVERY_MS
+FFT_EVERY_MS = 250
+FFT_SEGMENT_MS = 1000
+FFT_OVERLAP = 0.5
+
+# Time series with more than 2 samples per pixel are drawn as a min/max envelope
+DECIMATE_SAMPLES_PER_PIXEL = 2
+
+# numpy dtype of each lsl channel format, see channel_format_t below
+LSL_FORMAT_DTYPES = {
+    1: np.float32,
+    2: np.float64,
+    4: np.int32,
+    5: np.int16,
+    6: np.int8,
+    7: np.int64,
+}
 
 
 def get_lsl_stream_desc(stream: StreamInfo, channel_id: int = None):
@@ -26,10 +71,87 @@ def get_lsl_stream_desc(stream: StreamInfo, channel_id: int = None):
         label += f" channel {channel_id}"
     return label
 
+def is_on_screen(widget: QWidget):
+    # False when collapsed with its toggle button, in a tab not shown or scrolled out of view
+    if not widget.isVisible():
+        return False
+
+    # clip the widget by all its parents, a scroll area viewport is one of them
+    window = widget.window()
+    rect = QRect(widget.mapTo(window, QPoint(0, 0)), widget.size())
+    parent = widget.parentWidget()
+    while parent is not None and not rect.isEmpty():
+        rect = rect.intersected(QRect(parent.mapTo(window, QPoint(0, 0)), parent.size()))
+        parent = parent.parentWidget()
+    return not rect.isEmpty()
+
+def add_toggle_to_layout(layout, text: str, content: QWidget):
+    # Create the toggle button
+    toggle_button = QPushButton(text)
+    toggle_button.setStyleSheet("text-align: left; padding-left: 20px; border: 5px; border-color: #ffffff; background-color: #000000; color: #ffffff")
+
+    # Create the layout
+    layout.addWidget(toggle_button)
+    layout.addWidget(content)
+
+    def toggle_content():
+        # Toggle the visibility of the content widget
+        is_visible = content.isVisible()
+        content.setVisible(not is_visible)
+
+    toggle_button.clicked.connect(toggle_content)
+
+class EventStreamView():
+    """Events of a marker stream drawn as labelled vertical lines.
+
+    Lines are reused from one frame to the next, so the cost of a frame
+    depends on the number of events shown.
+    """
+
+    def __init__(self, lsl_stream: StreamInfo):
+        self.lsl_stream = lsl_stream
+        self.lines: List[pg.InfiniteLine] = []
+
+        self.ui_plot_widget = pg.PlotWidget()
+        self.ui_plot_widget.setXRange(0, BUFFER_DURATION_MS / 1000, padding=0)
+        self.ui_plot_widget.setYRange(0, 1)
+        self.ui_plot_widget.hideAxis("left")
+        self.ui_plot_widget.setMouseEnabled(x=False, y=False)
+
+        self.ui_splitter = QSplitter(Qt.Horizontal)
+        self.ui_splitter.addWidget(self.ui_plot_widget)
+        self.ui_splitter.setMinimumHeight(CHANNEL_MIN_HEIGHT)
+
+    def is_visible(self):
+        return is_on_screen(self.ui_splitter)
+
+    def set_events(self, positions: np.ndarray, labels: List[str]):
+        while len(self.lines) < len(positions):
+            line = pg.InfiniteLine(angle=90, movable=False, label="", labelOpts={"position": 0.9})
+            line.label_text = None
+            self.ui_plot_widget.addItem(line)
+            self.lines.append(line)
+
+        for line, position, label in zip(self.lines, positions, labels):
+            line.setPos(position)
+            if line.label_text != label:
+                # the label is a format string, escape the braces
+                line.label.setFormat(label.replace("{", "{{").replace("}", "}}"))
+                line.label_text = label
+            line.show()
+
+        for line in self.lines[len(positions):]:
+            line.hide()
+
+    def add_to_layout(self, layout):
+        add_toggle_to_layout(layout, get_lsl_stream_desc(self.lsl_stream), self.ui_splitter)
+
+
 class StreamChannel():
-    def __init__(self, lsl_stream: StreamInfo, channel_id: int):
+    def __init__(self, lsl_stream: StreamInfo, channel_id: int, buffer: RingBuffer):
         self.channel_id = channel_id
         self.lsl_stream = lsl_stream
+        self.buffer = buffer
 
 
         # from /usr/include/lsl_cpp.h
@@ -60,11 +182,30 @@ class StreamChannel():
         #	cf_undefined = 0
         #};
 
-        self.has_srate = True
-        if lsl_stream.channel_format() == 3:
-            print("got a variable rate stream")
-            self.has_srate = False
+        self.fs = lsl_stream.nominal_srate()
+        self.buffer_size = buffer.capacity
+
+        # The plots are only created the first time the channel is visible, see ensure_plots()
+        self.ui_plot_widget_ts = None
+        self.ui_plot_widget_fft = None
+
+        self.ui_splitter = QSplitter(Qt.Horizontal)
+        self.ui_splitter.setMinimumHeight(CHANNEL_MIN_HEIGHT)
+
+        # value of buffer.total_written when last rendered
+        self.rendered_samples = 0
         
+    @property
+    def label(self):
+        return get_lsl_stream_desc(self.lsl_stream, self.channel_id)
+
+    def is_visible(self):
+        return is_on_screen(self.ui_splitter)
+
+    def ensure_plots(self):
+        if self.ui_plot_widget_ts is not None:
+            return
+
         self.ui_plot_widget_ts = pg.PlotWidget()
         self.ui_plot_widget_fft = pg.PlotWidget()
 
@@ -73,48 +214,90 @@ class StreamChannel():
         #self.ui_plot_widget_ts.setLabel("bottom", "Time (s)")
 
         #self.ui_plot_widget_fft.setTitle(get_lsl_stream_desc(lsl_stream, channel_id))
-        self.ui_plot_widget_fft.setLabel("left", "Amplitude")
+        self.ui_plot_widget_fft.setLabel("left", "Power")
         self.ui_plot_widget_fft.setLabel("bottom", "Frequency (Hz)")
 
         self.ui_curve_ts = self.ui_plot_widget_ts.plot()
         self.ui_curve_fft = self.ui_plot_widget_fft.plot()
 
-        self.fs = lsl_stream.nominal_srate()
+        self.ui_splitter.addWidget(self.ui_plot_widget_ts)
+        self.ui_splitter.addWidget(self.ui_plot_widget_fft)
 
-        fs = self.fs
-        if fs == 0:
-            fs = PSEUDO_SRATE_FOR_EVENTS
+    @property
+    def data_buffer(self):
+        # View into the stream ring buffer, no copy
+        return self.buffer.channel_view(self.channel_id)
 
-        self.buffer_size = int(fs * BUFFER_DURATION_MS / 1000)
-        self.data_buffer = np.zeros(self.buffer_size)
+    def add_to_layout(self, layout):
+        add_toggle_to_layout(layout, get_lsl_stream_desc(self.lsl_stream, self.channel_id), self.ui_splitter)
+
+
+class StackedStreamView():
+    """All the channels of a stream drawn in a single plot, one above the other.
+
+    Each channel is scaled to its own range and shifted by its index, then all
+    the channels go in one curve item, so drawing a frame costs one setData
+    call whatever the number of channels.
+    """
+
+    def __init__(self, lsl_stream: StreamInfo, time_axis: np.ndarray, freqs: np.ndarray = None):
+        self.lsl_stream = lsl_stream
+        self.channel_count = lsl_stream.channel_count()
+        self.offsets = np.arange(self.channel_count)[:, np.newaxis]
+
+        self.ui_plot_widget_ts = pg.PlotWidget()
+        self.ui_plot_widget_fft = pg.PlotWidget()
+
+        self.ui_plot_widget_ts.setLabel("left", "Channel")
+        self.ui_plot_widget_fft.setLabel("left", "Channel")
+        self.ui_plot_widget_fft.setLabel("bottom", "Frequency (Hz)")
 
-        self.samples = []
+        ticks = [[(i, str(i)) for i in range(self.channel_count)]]
+        self.ui_plot_widget_ts.getAxis("left").setTicks(ticks)
+        self.ui_plot_widget_fft.getAxis("left").setTicks(ticks)
+
+        self.ui_curve_ts = pg.PlotCurveItem()
+        self.ui_curve_fft = pg.PlotCurveItem()
+        self.ui_plot_widget_ts.addItem(self.ui_curve_ts)
+        self.ui_plot_widget_fft.addItem(self.ui_curve_fft)
+
+        # x values and line breaks between channels are the same every frame
+        self.ts_x, self.ts_connect = self.get_stacked_axis(time_axis)
+        if freqs is not None:
+            self.fft_x, self.fft_connect = self.get_stacked_axis(freqs)
 
         self.ui_splitter = QSplitter(Qt.Horizontal)
         self.ui_splitter.addWidget(self.ui_plot_widget_ts)
         self.ui_splitter.addWidget(self.ui_plot_widget_fft)
-        
-    @property
-    def label(self):
-        return get_lsl_stream_desc(self.lsl_stream, self.channel_id)
+        self.ui_splitter.setMinimumHeight(max(CHANNEL_MIN_HEIGHT, self.channel_count * STACKED_CHANNEL_HEIGHT))
+
+        # value of buffer.total_written when last rendered
+        self.rendered_samples = 0
+
+    def get_stacked_axis(self, axis: np.ndarray):
+        x = np.tile(axis, self.channel_count)
+        connect = np.ones(len(x), dtype=bool)
+        connect[len(axis) - 1::len(axis)] = False
+        return x, connect
+
+    def stack(self, data: np.ndarray):
+        low = data.min(axis=1, keepdims=True)
+        high = data.max(axis=1, keepdims=True)
+        span = np.where(high > low, high - low, 1)
+        # keep a small gap between channels
+        return ((data - low) / span * 0.9 - 0.45 + self.offsets).ravel()
+
+    def is_visible(self):
+        return is_on_screen(self.ui_splitter)
+
+    def set_time_series(self, data: np.ndarray):
+        self.ui_curve_ts.setData(self.ts_x, self.stack(data), connect=self.ts_connect)
+
+    def set_spectrum(self, psd: np.ndarray):
+        self.ui_curve_fft.setData(self.fft_x, self.stack(psd), connect=self.fft_connect)
 
     def add_to_layout(self, layout):
-              # Create the toggle button
-        base_text = get_lsl_stream_desc(self.lsl_stream, self.channel_id)
-        toggle_button = QPushButton(base_text)
-        toggle_button.setStyleSheet("text-align: left; padding-left: 20px; border: 5px; border-color: #ffffff; background-color: #000000; color: #ffffff")
-        
-        # Create the layout
-        layout.addWidget(toggle_button)
-        layout.addWidget(self.ui_splitter)
-    
-        def toggle_content():
-            # Toggle the visibility of the content widget
-            is_visible = self.ui_splitter.isVisible()
-            self.ui_splitter.setVisible(not is_visible)
-            
-        toggle_button.clicked.connect(toggle_content)
-    
+        add_toggle_to_layout(layout, get_lsl_stream_desc(self.lsl_stream), self.ui_splitter)
 
 
 
@@ -122,24 +305,143 @@ class Stream():
     def __init__(self, lsl_stream: StreamInfo, ui_layout: QVBoxLayout):
         self.channel_count = lsl_stream.channel_count()
         self.lsl_stream = lsl_stream
-        self.lsl_inlet = StreamInlet(lsl_stream)
+        self.lsl_inlet = None
+        self.acquisition = None
         self.channels: List[StreamChannel] = []
+        self.stacked_view = None
+        self.event_view = None
+
+        # All the widgets of the stream, to hide them while the stream is lost
+        self.ui_widget = QWidget()
+        self.ui_layout = QVBoxLayout(self.ui_widget)
+        self.ui_layout.setContentsMargins(0, 0, 0, 0)
+        self.ui_layout.setSpacing(0)
+        ui_layout.addWidget(self.ui_widget)
+
+        self.has_srate = lsl_stream.channel_format() in LSL_FORMAT_DTYPES
+        if self.has_srate:
+            self.init_samples()
+        else:
+            print("got a variable rate stream")
+            self.init_events()
+
+        self.attach(lsl_stream)
+
+    def init_samples(self):
+        fs = self.lsl_stream.nominal_srate()
+        if fs == 0:
+            fs = SRATE_FOR_IRREGULAR_STREAMS
+
+        self.buffer_size = int(fs * BUFFER_DURATION_MS / 1000)
+        self.buffer = RingBuffer(self.channel_count, self.buffer_size)
+        self.time_axis = np.linspace(0, BUFFER_DURATION_MS / 1000, self.buffer_size)
+
+        # one (min, max) pair per pixel column of the screen
+        self.decimator = None
+        columns = QApplication.primaryScreen().size().width()
+        if self.buffer_size > DECIMATE_SAMPLES_PER_PIXEL * columns:
+            self.decimator = MinMaxDecimator(self.channel_count, self.buffer_size, columns)
+            self.envelope_time_axis = np.repeat(np.linspace(0, BUFFER_DURATION_MS / 1000, self.decimator.n_buckets), 2)
+
+        segment_length = min(self.buffer_size, int(fs * FFT_SEGMENT_MS / 1000))
+        self.spectrum = SpectralEngine(fs, segment_length, overlap=FFT_OVERLAP, every_ms=FFT_EVERY_MS)
+
+        # Wide streams get a single stacked view instead of one pair of plots per channel
+        if self.channel_count >= STACKED_VIEW_MIN_CHANNELS:
+            self.stacked_view = StackedStreamView(self.lsl_stream, self.time_series_axis, self.spectrum.freqs[1:])
+            self.stacked_view.add_to_layout(self.ui_layout)
+            return
 
         for i in range(self.channel_count):
-            channel = StreamChannel(lsl_stream, i)
+            channel = StreamChannel(self.lsl_stream, i, self.buffer)
             self.channels.append(channel)
-            channel.add_to_layout(ui_layout)
+            channel.add_to_layout(self.ui_layout)
             #ui_layout.addWidget(channel.ui_splitter)
 
+    def init_events(self):
+        self.events = EventBuffer(keep_duration=BUFFER_DURATION_MS / 1000)
+        self.event_view = EventStreamView(self.lsl_stream)
+        self.event_view.add_to_layout(self.ui_layout)
+
+    def attach(self, lsl_stream: StreamInfo):
+        """Start pulling from `lsl_stream`, into the buffers this stream already has.
+
+        Inlets do not recover by themselves, liblsl would block the pulls
+        meanwhile: a restarted source is attached again by the discovery.
+        """
+        self.lsl_stream = lsl_stream
+
+        if self.has_srate:
+            self.lsl_inlet = StreamInlet(lsl_stream, recover=False)
+            self.acquisition = StreamAcquisition(
+                self.lsl_inlet,
+                every_ms=ACQUIRE_EVERY_MS,
+                max_chunk_samples=MAX_CHUNK_SAMPLES,
+                buffer=self.buffer,
+                dtype=LSL_FORMAT_DTYPES[lsl_stream.channel_format()],
+                decimator=self.decimator,
+            )
+        else:
+            # Marker timestamps are converted to the local clock by liblsl, to be compared with local_clock()
+            self.lsl_inlet = StreamInlet(lsl_stream, processing_flags=proc_clocksync, recover=False)
+            self.acquisition = StreamAcquisition(
+                self.lsl_inlet,
+                every_ms=ACQUIRE_EVERY_MS,
+                max_chunk_samples=MAX_CHUNK_SAMPLES,
+                events=self.events,
+                corrected_timestamps=True,
+            )
+
+        self.acquisition.start()
+        self.ui_widget.setVisible(True)
+
+    def detach(self):
+        """Stop pulling and hide the stream, its buffers are kept for a later attach()."""
+        self.close()
+        self.lsl_inlet = None
+        self.acquisition = None
+        self.ui_widget.setVisible(False)
+
+    @property
+    def is_attached(self):
+        return self.acquisition is not None
+
+    def is_compatible(self, lsl_stream: StreamInfo):
+        # the buffers can be reused if the shape of the data did not change
+        return (
+            lsl_stream.channel_count() == self.channel_count
+            and lsl_stream.channel_format() == self.lsl_stream.channel_format()
+            and lsl_stream.nominal_srate() == self.lsl_stream.nominal_srate()
+        )
+
     @property
     def label(self):
         return get_lsl_stream_desc(self.lsl_stream)
-    
+
+    @property
+    def time_series_axis(self):
+        if self.decimator is not None:
+            return self.envelope_time_axis
+        return self.time_axis
+
+    def time_series_snapshot(self):
+        # the size of the envelope depends on the screen width, not on the sample rate
+        if self.decimator is not None:
+            return self.decimator.snapshot()
+        data, _ = self.buffer.snapshot()
+        return data
+
+    def close(self):
+        if self.acquisition is not None:
+            self.acquisition.stop()
+            self.acquisition.join()
+
 
 class MainWindow(QMainWindow):
-    def __init__(self):
+    def __init__(self, discover: bool = True):
         super().__init__()
         self.streams: List[Stream] = []
+        self.streams_by_key: Dict[str, Stream] = {}
 
         self.tabs = QTabWidget(self)
 
@@ -147,34 +449,81 @@ class MainWindow(QMainWindow):
         tab_signals_layout = QVBoxLayout(tab_signals_widget)
         tab_signals_widget.setLayout(tab_signals_layout)
         tab_signals_layout.setSpacing(0)
+        self.tab_signals_layout = tab_signals_layout
 
-        tab_info_widget = QLabel(self, text="Foo")
-        tab_info_layout = QVBoxLayout(tab_info_widget)
-        tab_info_widget.setLayout(tab_info_layout)
+        self.frame_stats = FrameStats()
+        self.hud = PerformanceHud()
+        tab_info_widget = QScrollArea(self)
+        tab_info_widget.setWidgetResizable(True)
+        tab_info_widget.setWidget(self.hud.ui_label)
 
-        self.tabs.addTab(tab_signals_widget, "Signals")
-        self.tabs.addTab(tab_info_widget, "Info")
+        tab_signals_scroll = QScrollArea(self)
+        tab_signals_scroll.setWidgetResizable(True)
+        tab_signals_scroll.setWidget(tab_signals_widget)
 
-        print("Looking for LSL stream...")
-        lsl_streams = resolve_streams()
-        if len(lsl_streams) == 0:
-            print("No LSL stream available")
-            sys.exit(1)
+        self.tabs.addTab(tab_signals_scroll, "Signals")
+        self.tabs.addTab(tab_info_widget, "Info")
 
-        print(lsl_streams)
-        for lsl_stream in lsl_streams:
-            stream = Stream(lsl_stream, tab_signals_layout)
-            print(f"Connected: {get_lsl_stream_desc(lsl_stream, 0)}")
-            self.streams.append(stream)
+        # Streams are added and removed as they appear and disappear on the network,
+        # without discovery they are added with add_stream()
+        self.discovery = None
+        if discover:
+            print("Looking for LSL stream...")
+            self.discovery = StreamDiscovery(every_ms=DISCOVERY_EVERY_MS, forget_after=DISCOVERY_FORGET_AFTER_MS / 1000)
+            self.discovery.start()
 
         self.setCentralWidget(self.tabs)
         self.setup_timers()
 
     def setup_timers(self):
-        self.last_run = local_clock()
         self.timer = QTimer()
         self.timer.timeout.connect(self.update_plot)
         self.timer.start(REFRESH_EVERY_MS)
+
+        self.discovery_timer = QTimer()
+        self.discovery_timer.timeout.connect(self.update_streams)
+        if self.discovery is not None:
+            self.discovery_timer.start(DISCOVERY_EVERY_MS)
+
+        self.hud_timer = QTimer()
+        self.hud_timer.timeout.connect(lambda: self.hud.refresh(self.streams, self.frame_stats))
+        self.hud_timer.start(HUD_EVERY_MS)
+
+    def update_streams(self):
+        for change, lsl_stream in self.discovery.get_changes():
+            key = get_stream_key(lsl_stream)
+            stream = self.streams_by_key.get(key)
+
+            if change == "lost":
+                # only if it is not already attached to a newer instance of the stream
+                if stream is not None and stream.is_attached and stream.lsl_stream.uid() == lsl_stream.uid():
+                    print(f"Lost: {stream.label}")
+                    stream.detach()
+                continue
+
+            if stream is not None and stream.is_compatible(lsl_stream):
+                # a source restarted before its previous instance was lost, the buffers are kept
+                if stream.is_attached:
+                    stream.detach()
+                stream.attach(lsl_stream)
+                print(f"Reconnected: {stream.label}")
+                continue
+
+            if stream is not None:
+                # same source with another shape, the old one is replaced
+                stream.detach()
+                self.tab_signals_layout.removeWidget(stream.ui_widget)
+                stream.ui_widget.deleteLater()
+                self.streams.remove(stream)
+
+            self.add_stream(lsl_stream)
+
+    def add_stream(self, lsl_stream: StreamInfo):
+        stream = Stream(lsl_stream, self.tab_signals_layout)
+        print(f"Connected: {get_lsl_stream_desc(lsl_stream, 0)}")
+        self.streams.append(stream)
+        self.streams_by_key[get_stream_key(lsl_stream)] = stream
+        return stream
     
     def keyPressEvent(self, event):
         if event.key() == Qt.Key.Key_Escape:
@@ -186,67 +535,98 @@ class MainWindow(QMainWindow):
             self.tabs.setCurrentIndex(self.tabs.currentIndex() + 1)
         else:
             print(f"Key pressed: {event.text()}")
-    
+
+    def closeEvent(self, event):
+        self.timer.stop()
+        self.discovery_timer.stop()
+        self.hud_timer.stop()
+        if self.discovery is not None:
+            self.discovery.stop()
+        for stream in self.streams:
+            stream.close()
+        super().closeEvent(event)
 
     def update_plot(self):
-        has_data = False
+        frame_start = time.perf_counter()
         now = local_clock()
-        elapsed = now - self.last_run
-        self.last_run = now
 
         for stream in self.streams:
-            for channel in stream.channels:
-                if channel.has_srate:
-                    channel.samples = []
-                else:
-                    has_data = True
-                    fill_size = PSEUDO_SRATE_FOR_EVENTS * elapsed
-                    fill_size = int(round(fill_size))
-                    channel.samples = [0] * fill_size
-
-            # read all there is
-            while True:
-                #sample, timestamp = stream.lsl_inlet.pull_sample(timeout=0.0) # have a 0.0 timeout to avoid blocking here
-                chunk, timestamps = stream.lsl_inlet.pull_chunk(timeout=0.0) # have a 0.0 timeout to avoid blocking here
-                if len(chunk) == 0:
-                    break # exit while True loop
-
-                #print(f"stream '{stream.label}' len of chunk: {len(chunk)}")
-
-                has_data = True
-                for channel in stream.channels:
-                    if channel.has_srate:
-                        for sample in chunk:
-                            channel.samples.append(sample[channel.channel_id])
-                    else:
-                        now = local_clock()
-                        for timestamp in timestamps:
-                            delta_t = now - timestamp
-                            neg_id = int(delta_t * PSEUDO_SRATE_FOR_EVENTS)
-
-                            channel.samples[-neg_id] = 1
-                            
-            if not has_data:
+            if not stream.is_attached:
                 continue # next stream
 
-            for channel in stream.channels:
-                new_data = np.array(channel.samples)
-                if len(new_data) == 0:
-                    continue # next channel
+            if stream.event_view is not None:
+                self.update_event_view(stream, now)
+            elif stream.stacked_view is not None:
+                self.update_stacked_view(stream, now)
+            else:
+                self.update_channels(stream, now)
+
+        self.frame_stats.end_frame(time.perf_counter() - frame_start)
+
+    def update_channels(self, stream: Stream, now: float):
+        # Hidden channels keep being acquired but are only rendered once visible again
+        total_written = stream.buffer.total_written
+        channels = [channel for channel in stream.channels if channel.rendered_samples != total_written and channel.is_visible()]
+        if len(channels) == 0:
+            return
+
+        # only copy the latest data, the acquisition threads do the pulling
+        time_axis = stream.time_series_axis
+        with self.frame_stats.measure("snapshot"):
+            ts_data = stream.time_series_snapshot()
+
+        with self.frame_stats.measure("setData"):
+            for channel in channels:
+                channel.ensure_plots()
+                channel.ui_curve_ts.setData(time_axis, ts_data[channel.channel_id])
+                channel.rendered_samples = total_written
+
+        # fft, all the visible channels of the stream at once
+        if stream.spectrum.is_due(now):
+            with self.frame_stats.measure("fft"):
+                data, _ = stream.buffer.snapshot()
+                channel_ids = [channel.channel_id for channel in channels]
+                freqs, psd = stream.spectrum.welch(data[channel_ids])
+
+            with self.frame_stats.measure("setData"):
+                for i, channel in enumerate(channels):
+                    # don't display index 0 to help visibility
+                    channel.ui_curve_fft.setData(freqs[1:], psd[i, 1:])
 
-                channel.data_buffer = np.roll(channel.data_buffer, -len(new_data))
-                channel.data_buffer[-len(new_data):] = new_data
+    def update_event_view(self, stream: Stream, now: float):
+        view = stream.event_view
+        if not view.is_visible():
+            return
 
-                # time series
-                channel.ui_curve_ts.setData(np.linspace(0, BUFFER_DURATION_MS / 1000, len(channel.data_buffer)), channel.data_buffer)
+        # events move to the left as time passes, they are redrawn every frame
+        duration = BUFFER_DURATION_MS / 1000
+        with self.frame_stats.measure("snapshot"):
+            timestamps, labels = stream.events.query(now - duration, now)
 
-                # fft
-                if channel.has_srate:
-                    fft_result = np.fft.rfft(channel.data_buffer)
-                    freqs = np.fft.rfftfreq(len(channel.data_buffer), 1/channel.fs)
-                    magnitude = np.abs(fft_result)
-                    # don't display index 0 to help visibility
-                    channel.ui_curve_fft.setData(freqs[1:], magnitude[1:])
+        with self.frame_stats.measure("setData"):
+            view.set_events(duration - (now - timestamps), labels)
+
+    def update_stacked_view(self, stream: Stream, now: float):
+        view = stream.stacked_view
+        total_written = stream.buffer.total_written
+        if view.rendered_samples == total_written or not view.is_visible():
+            return
+        view.rendered_samples = total_written
+
+        with self.frame_stats.measure("snapshot"):
+            ts_data = stream.time_series_snapshot()
+
+        with self.frame_stats.measure("setData"):
+            view.set_time_series(ts_data)
+
+        if stream.spectrum.is_due(now):
+            with self.frame_stats.measure("fft"):
+                data, _ = stream.buffer.snapshot()
+                _, psd = stream.spectrum.welch(data)
+
+            with self.frame_stats.measure("setData"):
+                # don't display index 0 to help visibility
+                view.set_spectrum(psd[:, 1:])
 
 # Set as global so we can relaunch the app from a shortcut
 main_window = None
@@ -271,6 +651,7 @@ def relaunch_main():
     
     
 if __name__ == "__main__":
+    pg.setConfigOptions(useOpenGL=USE_OPENGL, enableExperimental=USE_OPENGL)
     app = QApplication([])
     relaunch_main()
     #main = MainWindow()
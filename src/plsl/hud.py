@@ -0,0 +1,123 @@
+from collections import defaultdict
+from contextlib import contextmanager
+import time
+
+from PySide6.QtWidgets import QLabel
+from PySide6.QtCore import Qt
+from PySide6.QtGui import QFontDatabase
+
+FRAME_STEPS = ["snapshot", "fft", "setData"]
+
+
+class FrameStats():
+    """Time spent in each step of update_plot, accumulated between two HUD refreshes.
+
+    Frames where no step was measured, nothing being visible, are not counted.
+    """
+
+    def __init__(self):
+        self.reset()
+        self.has_work = False
+
+    def reset(self):
+        self.frames = 0
+        self.frame_time = 0.0
+        self.max_frame_time = 0.0
+        self.step_times = defaultdict(float)
+
+    @contextmanager
+    def measure(self, step: str):
+        start = time.perf_counter()
+        yield
+        self.step_times[step] += time.perf_counter() - start
+        self.has_work = True
+
+    def end_frame(self, frame_time: float):
+        if not self.has_work:
+            return
+        self.has_work = False
+
+        self.frames += 1
+        self.frame_time += frame_time
+        self.max_frame_time = max(self.max_frame_time, frame_time)
+
+
+class PerformanceHud():
+    """Live instrumentation of the streams and of the rendering, shown in the "Info" tab.
+
+    Rates are computed from the difference of the counters between two
+    refreshes, so the numbers are averages over the last refresh period.
+    Nothing is rendered while this tab is shown, so the frame times are the
+    ones of the last period with rendered frames.
+    """
+
+    def __init__(self):
+        self.ui_label = QLabel()
+        self.ui_label.setAlignment(Qt.AlignTop | Qt.AlignLeft)
+        self.ui_label.setTextInteractionFlags(Qt.TextSelectableByMouse)
+        self.ui_label.setFont(QFontDatabase.systemFont(QFontDatabase.FixedFont))
+        self.ui_label.setText("Waiting for data...")
+
+        # counters of each AcquisitionStats at the previous refresh
+        self.previous = {}
+        self.last_refresh = time.perf_counter()
+
+        self.frame_lines = ["  nothing rendered yet"]
+        self.last_frame_refresh = None
+
+    def refresh(self, streams, frame_stats: FrameStats):
+        now = time.perf_counter()
+        elapsed = now - self.last_refresh
+        self.last_refresh = now
+
+        lines = ["Streams"]
+        previous = {}
+        for stream in streams:
+            if not stream.is_attached:
+                lines.append(f"  {stream.label}  lost")
+                continue
+
+            stats = stream.acquisition.stats
+            samples, chunks, pull_time = stats.samples, stats.chunks, stats.pull_time
+            last_samples, last_chunks, last_pull_time = self.previous.get(id(stats), (0, 0, 0.0))
+            previous[id(stats)] = (samples, chunks, pull_time)
+
+            rate = (samples - last_samples) / elapsed
+            new_chunks = chunks - last_chunks
+            mean_chunk = (samples - last_samples) / new_chunks if new_chunks > 0 else 0
+            max_chunk = stats.max_chunk_size
+            stats.max_chunk_size = 0
+
+            latency = "     -"
+            if stats.latency is not None:
+                latency = f"{stats.latency * 1000:6.1f}"
+
+            lines.append(f"  {stream.label}")
+            lines.append(
+                f"    rate {rate:9.1f} / {stream.lsl_stream.nominal_srate():9.1f} Hz"
+                f"   chunk {mean_chunk:7.1f} avg {max_chunk:6d} max"
+                f"   latency {latency} ms"
+                f"   backlog {stats.backlog:6d}"
+                f"   pull {(pull_time - last_pull_time) / elapsed * 1000:6.2f} ms/s"
+            )
+        self.previous = previous
+
+        if frame_stats.frames > 0:
+            frames = frame_stats.frames
+            steps = "   ".join(f"{step} {frame_stats.step_times[step] / frames * 1000:7.2f} ms" for step in FRAME_STEPS)
+            self.frame_lines = [
+                f"  {frames / elapsed:5.1f} fps"
+                f"   frame {frame_stats.frame_time / frames * 1000:7.2f} ms avg {frame_stats.max_frame_time * 1000:7.2f} ms max",
+                f"  per frame: {steps}",
+            ]
+            self.last_frame_refresh = now
+        frame_stats.reset()
+
+        lines.append("")
+        if self.last_frame_refresh is None or self.last_frame_refresh == now:
+            lines.append("Frames")
+        else:
+            lines.append(f"Frames ({now - self.last_frame_refresh:.0f} s ago)")
+        lines.extend(self.frame_lines)
+
+        self.ui_label.setText("\n".join(lines))
@@ -0,0 +1,64 @@
+import threading
+
+import numpy as np
+
+
+class RingBuffer():
+    """Fixed size (channels x samples) buffer with a write head.
+
+    The storage is twice the capacity and every sample is written twice, once
+    in each half. This way the last `capacity` samples are always contiguous
+    in memory and `view()` never has to copy or roll anything.
+
+    Appends happen on the acquisition thread, readers on another thread should
+    go through `snapshot()`.
+    """
+
+    def __init__(self, channel_count: int, capacity: int, dtype=np.float64):
+        self.channel_count = channel_count
+        self.capacity = capacity
+        self.data = np.zeros((channel_count, 2 * capacity), dtype=dtype)
+        self.head = 0
+        self.total_written = 0
+        self.lock = threading.Lock()
+
+    def append(self, chunk: np.ndarray):
+        """Append a (channels x n) chunk. Cost is O(n), whatever the capacity."""
+        n = chunk.shape[1]
+        if n == 0:
+            return
+
+        with self.lock:
+            # Only the tail of a chunk larger than the buffer can be kept
+            if n > self.capacity:
+                self.total_written += n - self.capacity
+                chunk = chunk[:, -self.capacity:]
+                n = self.capacity
+
+            cap = self.capacity
+            start = self.head
+            first = min(n, cap - start)
+
+            self.data[:, start:start + first] = chunk[:, :first]
+            self.data[:, start + cap:start + cap + first] = chunk[:, :first]
+
+            # Wrap around
+            rest = n - first
+            if rest > 0:
+                self.data[:, :rest] = chunk[:, first:]
+                self.data[:, cap:cap + rest] = chunk[:, first:]
+
+            self.head = (start + n) % cap
+            self.total_written += n
+
+    def view(self) -> np.ndarray:
+        """Zero-copy (channels x capacity) view, oldest sample first."""
+        return self.data[:, self.head:self.head + self.capacity]
+
+    def channel_view(self, channel_id: int) -> np.ndarray:
+        return self.data[channel_id, self.head:self.head + self.capacity]
+
+    def snapshot(self):
+        """Consistent copy of `view()` and the matching `total_written`."""
+        with self.lock:
+            return self.view().copy(), self.total_written
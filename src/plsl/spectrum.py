@@ -0,0 +1,66 @@
+from functools import lru_cache
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+@lru_cache(maxsize=32)
+def get_window(length: int):
+    # periodic hann window, better suited than the symmetric one for spectral analysis
+    window = np.hanning(length + 1)[:-1]
+    window.flags.writeable = False
+    return window
+
+
+@lru_cache(maxsize=32)
+def get_freqs(length: int, fs: float):
+    freqs = np.fft.rfftfreq(length, 1 / fs)
+    freqs.flags.writeable = False
+    return freqs
+
+
+class SpectralEngine():
+    """Welch spectrum of all the channels of a stream, computed at its own rate.
+
+    The (channels x samples) data is cut in overlapping hann windowed segments
+    and every segment of every channel goes through a single rfft call.
+    """
+
+    def __init__(self, fs: float, segment_length: int, overlap: float = 0.5, every_ms: float = 250):
+        self.fs = fs
+        self.segment_length = segment_length
+        self.step = max(1, int(segment_length * (1 - overlap)))
+        self.every_ms = every_ms
+        self.last_run = None
+
+    @property
+    def freqs(self):
+        return get_freqs(self.segment_length, self.fs)
+
+    def is_due(self, now: float):
+        """Check if `every_ms` elapsed since the last run, `now` is in seconds."""
+        if self.last_run is not None and (now - self.last_run) * 1000 < self.every_ms:
+            return False
+        self.last_run = now
+        return True
+
+    def stft(self, data: np.ndarray):
+        """Spectrum of every segment, shape is (channels x segments x freqs)."""
+        segments = sliding_window_view(data, self.segment_length, axis=-1)[:, ::self.step]
+        # remove the mean of each segment, like scipy.signal.welch(detrend='constant')
+        segments = segments - segments.mean(axis=-1, keepdims=True)
+        return np.fft.rfft(segments * get_window(self.segment_length), axis=-1)
+
+    def welch(self, data: np.ndarray):
+        """Power spectral density averaged over the segments, shape is (channels x freqs)."""
+        window = get_window(self.segment_length)
+        psd = np.mean(np.abs(self.stft(data)) ** 2, axis=1)
+        psd /= self.fs * np.sum(window ** 2)
+
+        # one-sided spectrum, the energy of the negative frequencies is folded in
+        if self.segment_length % 2 == 0:
+            psd[:, 1:-1] *= 2
+        else:
+            psd[:, 1:] *= 2
+
+        return self.freqs, psd
@@ -0,0 +1,134 @@
+import argparse
+import concurrent.futures
+import os
+import time
+
+import h5py
+import numpy as np
+
+from xdf_file import TAG_CLOCK_OFFSET, TAG_SAMPLES, TAG_STREAM_FOOTER, TAG_STREAM_HEADER, XdfReader, XdfStream
+
+## Convert XDF files to HDF5, one group per stream, reading the XDF a chunk at a time.
+##
+## poetry run python src/xdf/convert_xdf_to_hdf5.py recordings/*.xdf --compression gzip
+##
+## with h5py.File("recording.h5") as f:
+##     for group in f["streams"].values():
+##         print(group.attrs["name"], group["time_series"].shape, group["time_stamps"][:10])
+
+# samples per HDF5 chunk, reading a window reads whole chunks
+HDF5_CHUNK_SAMPLES = 4096
+
+COMPRESSIONS = ["none", "gzip", "lzf"]
+
+
+class StreamWriter():
+    """Append the samples and clock offsets of a stream to resizable datasets of an HDF5 group."""
+
+    def __init__(self, group: h5py.Group, stream: XdfStream, compression: str):
+        self.group = group
+        for key in ["name", "type", "channel_count", "nominal_srate", "channel_format", "source_id", "header_xml"]:
+            group.attrs[key] = getattr(stream, key)
+
+        dtype = stream.dtype if stream.dtype is not None else h5py.string_dtype()
+        options = {}
+        if compression != "none":
+            options["compression"] = compression
+
+        self.time_series = group.create_dataset(
+            "time_series",
+            shape=(0, stream.channel_count),
+            maxshape=(None, stream.channel_count),
+            dtype=dtype,
+            chunks=(HDF5_CHUNK_SAMPLES, stream.channel_count),
+            **options,
+        )
+        self.time_stamps = group.create_dataset("time_stamps", shape=(0,), maxshape=(None,), dtype=np.float64, chunks=(HDF5_CHUNK_SAMPLES,), **options)
+        # (collection time, offset) rows
+        self.clock_offsets = group.create_dataset("clock_offsets", shape=(0, 2), maxshape=(None, 2), dtype=np.float64, chunks=(256, 2))
+
+    def append(self, dataset: h5py.Dataset, values):
+        start = dataset.shape[0]
+        dataset.resize(start + len(values), axis=0)
+        dataset[start:] = values
+
+    def append_samples(self, timestamps, values):
+        self.append(self.time_stamps, timestamps)
+        self.append(self.time_series, values)
+
+    def append_clock_offset(self, collection_time: float, offset: float):
+        self.append(self.clock_offsets, [[collection_time, offset]])
+
+
+def get_output_path(path: str, output_dir: str):
+    output_path = os.path.splitext(path)[0] + ".h5"
+    if output_dir is not None:
+        output_path = os.path.join(output_dir, os.path.basename(output_path))
+    return output_path
+
+
+def convert(path: str, output_path: str, compression: str):
+    """Convert one XDF file, memory use is bounded by the largest chunk of the file."""
+    start = time.perf_counter()
+    # an interrupted conversion does not leave a file that looks complete
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    samples = 0
+
+    try:
+        with XdfReader(path) as reader, h5py.File(tmp_path, "w") as output:
+            streams = output.create_group("streams")
+            writers = {}
+
+            for tag, stream, payload in reader:
+                if tag == TAG_STREAM_HEADER:
+                    writers[stream.stream_id] = StreamWriter(streams.create_group(str(stream.stream_id)), stream, compression)
+                elif tag == TAG_SAMPLES:
+                    timestamps, values = payload
+                    if len(timestamps) > 0:
+                        writers[stream.stream_id].append_samples(timestamps, values)
+                        samples += len(timestamps)
+                elif tag == TAG_CLOCK_OFFSET:
+                    writers[stream.stream_id].append_clock_offset(*payload)
+                elif tag == TAG_STREAM_FOOTER:
+                    writers[stream.stream_id].group.attrs["footer_xml"] = stream.footer_xml
+
+            if reader.header_xml is not None:
+                output.attrs["header_xml"] = reader.header_xml
+
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return output_path, samples, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert XDF files to HDF5, with bounded memory.")
+    parser.add_argument("paths", nargs="+", help="XDF files, .xdf or .xdfz")
+    parser.add_argument("--output-dir", help="directory of the HDF5 files, next to the XDF files by default")
+    parser.add_argument("--compression", choices=COMPRESSIONS, default="none")
+    parser.add_argument("--processes", type=int, default=os.cpu_count(), help="files converted in parallel")
+    args = parser.parse_args()
+
+    if args.output_dir is not None:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    # a file per process, the conversion of a file is sequential
+    with concurrent.futures.ProcessPoolExecutor(max_workers=min(args.processes, len(args.paths))) as executor:
+        futures = {
+            executor.submit(convert, path, get_output_path(path, args.output_dir), args.compression): path
+            for path in args.paths
+        }
+        for future in concurrent.futures.as_completed(futures):
+            path = futures[future]
+            try:
+                output_path, samples, duration = future.result()
+                print(f"Converted {path} to {output_path}, {samples} samples in {duration:.1f} s")
+            except Exception as e:
+                print(f"Failed to convert {path}: {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+import argparse
+import collections
+import os
+import queue
+import threading
+import time
+
+import h5py
+import numpy as np
+from pylsl import StreamInlet, local_clock, resolve_streams
+# pylsl raises its own classes, which are not the builtin TimeoutError
+from pylsl.util import LostError, TimeoutError as LslTimeoutError
+
+from convert_xdf_to_hdf5 import COMPRESSIONS, StreamWriter
+from xdf_file import XdfStream, XdfWriter
+
+## Record LSL streams to XDF or HDF5.
+##
+## poetry run python src/xdf/record_lsl_streams.py recording.xdf
+## poetry run python src/xdf/record_lsl_streams.py recording.h5 --streams ReplayHexoskinECG ReplayHexoskinResp
+
+RESOLVE_TIMEOUT_S = 2
+PULL_TIMEOUT_S = 0.2
+MAX_CHUNK_SAMPLES = 4096
+
+# chunks waiting to be written, per stream. When the queue is full, the puller
+# waits and the samples wait in the buffer of the inlet, nothing is dropped.
+QUEUE_CHUNKS = 1024
+INLET_BUFFER_S = 360
+
+# a chunk of samples is written per stream at most every WRITE_EVERY_S
+WRITE_EVERY_S = 1
+FSYNC_EVERY_S = 5
+BOUNDARY_EVERY_S = 10
+TIME_CORRECTION_EVERY_S = 5
+TIME_CORRECTION_TIMEOUT_S = 1
+
+
+class InletPuller(threading.Thread):
+    """Pull a stream into the queue of the writer, with its clock offsets."""
+
+    def __init__(self, stream_id: int, lsl_stream, writer_queue: queue.Queue):
+        super().__init__(daemon=True)
+        self.stream_id = stream_id
+        self.inlet = StreamInlet(lsl_stream, max_buflen=INLET_BUFFER_S, max_chunklen=MAX_CHUNK_SAMPLES)
+        self.stream = XdfStream(stream_id, self.inlet.info().as_xml())
+        self.queue = writer_queue
+        self.stop_event = threading.Event()
+
+        # numeric samples are pulled in a preallocated buffer, then copied to the queue
+        self.pull_buffer = None
+        if self.stream.dtype is not None:
+            self.pull_buffer = np.zeros((MAX_CHUNK_SAMPLES, self.stream.channel_count), dtype=self.stream.dtype)
+
+    def run(self):
+        self.inlet.open_stream()
+        next_time_correction = 0
+
+        while not self.stop_event.is_set():
+            if local_clock() >= next_time_correction:
+                self.put_time_correction()
+                next_time_correction = local_clock() + TIME_CORRECTION_EVERY_S
+
+            if self.pull_buffer is not None:
+                _, timestamps = self.inlet.pull_chunk(timeout=PULL_TIMEOUT_S, max_samples=MAX_CHUNK_SAMPLES, dest_obj=self.pull_buffer)
+                values = self.pull_buffer[:len(timestamps)].copy()
+            else:
+                values, timestamps = self.inlet.pull_chunk(timeout=PULL_TIMEOUT_S, max_samples=MAX_CHUNK_SAMPLES)
+
+            if len(timestamps) > 0:
+                self.queue.put(("samples", self.stream_id, np.array(timestamps), values))
+
+        # the last clock offset brackets the last samples
+        self.put_time_correction()
+
+    def put_time_correction(self):
+        try:
+            offset = self.inlet.time_correction(timeout=TIME_CORRECTION_TIMEOUT_S)
+            self.queue.put(("clock_offset", self.stream_id, local_clock(), offset))
+        except (LslTimeoutError, LostError) as e:
+            # the samples keep being pulled, the offset is measured again later
+            print(f"Time correction of {self.stream.name} failed: {type(e).__name__}")
+
+    def stop(self):
+        self.stop_event.set()
+
+
+class XdfSink():
+    def __init__(self, path: str):
+        self.path = path
+        self.writer = XdfWriter(path)
+        self.last_boundary = time.perf_counter()
+
+    def add_stream(self, stream: XdfStream):
+        self.writer.write_stream_header(stream)
+
+    def write_samples(self, stream: XdfStream, timestamps, values):
+        self.writer.write_samples(stream, timestamps, values)
+
+        # lets readers resynchronize after a corrupted part of the file
+        if time.perf_counter() - self.last_boundary > BOUNDARY_EVERY_S:
+            self.writer.write_boundary()
+            self.last_boundary = time.perf_counter()
+
+    def write_clock_offset(self, stream: XdfStream, collection_time: float, offset: float):
+        self.writer.write_clock_offset(stream.stream_id, collection_time, offset)
+
+    def sync(self):
+        self.writer.file.flush()
+        os.fsync(self.writer.file.fileno())
+
+    def close(self, streams, stats):
+        for stream in streams:
+            first_timestamp, last_timestamp, sample_count = stats[stream.stream_id]
+            self.writer.write_stream_footer(stream.stream_id, (
+                '<?xml version="1.0"?><info>'
+                f'<first_timestamp>{first_timestamp}</first_timestamp>'
+                f'<last_timestamp>{last_timestamp}</last_timestamp>'
+                f'<sample_count>{sample_count}</sample_count>'
+                '</info>'
+            ))
+        self.sync()
+        self.writer.close()
+
+
+class Hdf5Sink():
+    def __init__(self, path: str, compression: str):
+        self.path = path
+        self.compression = compression
+        self.file = h5py.File(path, "w")
+        self.streams = self.file.create_group("streams")
+        self.writers = {}
+
+    def add_stream(self, stream: XdfStream):
+        group = self.streams.create_group(str(stream.stream_id))
+        self.writers[stream.stream_id] = StreamWriter(group, stream, self.compression)
+
+    def write_samples(self, stream: XdfStream, timestamps, values):
+        self.writers[stream.stream_id].append_samples(timestamps, values)
+
+    def write_clock_offset(self, stream: XdfStream, collection_time: float, offset: float):
+        self.writers[stream.stream_id].append_clock_offset(collection_time, offset)
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.id.get_vfd_handle())
+
+    def close(self, streams, stats):
+        for stream in streams:
+            first_timestamp, last_timestamp, sample_count = stats[stream.stream_id]
+            attrs = self.writers[stream.stream_id].group.attrs
+            attrs["first_timestamp"] = first_timestamp
+            attrs["last_timestamp"] = last_timestamp
+            attrs["sample_count"] = sample_count
+        self.file.close()
+
+
+class Recorder(threading.Thread):
+    """Write what the pullers queue, in batches, to a sink.
+
+    Samples are grouped per stream for WRITE_EVERY_S before being written,
+    so the file has few large chunks. The disk is only written from this
+    thread, a slow write never delays the pulls.
+    """
+
+    def __init__(self, lsl_streams, sink):
+        super().__init__(daemon=True)
+        self.sink = sink
+        self.queue = queue.Queue(maxsize=QUEUE_CHUNKS * len(lsl_streams))
+        self.pullers = [InletPuller(stream_id, lsl_stream, self.queue) for stream_id, lsl_stream in enumerate(lsl_streams, start=1)]
+        self.streams = {puller.stream_id: puller.stream for puller in self.pullers}
+        self.stop_event = threading.Event()
+
+        # stream id -> list of (timestamps, values) waiting to be written
+        self.batches = collections.defaultdict(list)
+        # stream id -> (first timestamp, last timestamp, sample count)
+        self.stats = {stream_id: (0.0, 0.0, 0) for stream_id in self.streams}
+
+    def run(self):
+        for stream in self.streams.values():
+            self.sink.add_stream(stream)
+        for puller in self.pullers:
+            puller.start()
+
+        last_write = time.perf_counter()
+        last_sync = last_write
+        while not self.stop_event.is_set() or any(puller.is_alive() for puller in self.pullers) or not self.queue.empty():
+            try:
+                self.handle(self.queue.get(timeout=WRITE_EVERY_S))
+            except queue.Empty:
+                pass
+
+            now = time.perf_counter()
+            if now - last_write > WRITE_EVERY_S:
+                self.write_batches()
+                last_write = now
+            if now - last_sync > FSYNC_EVERY_S:
+                self.sink.sync()
+                last_sync = now
+
+        self.write_batches()
+        self.sink.close(self.streams.values(), self.stats)
+
+    def handle(self, item):
+        kind, stream_id, *payload = item
+        if kind == "samples":
+            self.batches[stream_id].append(payload)
+        elif kind == "clock_offset":
+            self.sink.write_clock_offset(self.streams[stream_id], *payload)
+
+    def write_batches(self):
+        for stream_id, batch in self.batches.items():
+            if len(batch) == 0:
+                continue
+            stream = self.streams[stream_id]
+            timestamps = np.concatenate([timestamps for timestamps, _ in batch])
+            if stream.dtype is not None:
+                values = np.concatenate([values for _, values in batch])
+            else:
+                values = [sample for _, chunk_values in batch for sample in chunk_values]
+            batch.clear()
+
+            self.sink.write_samples(stream, timestamps, values)
+
+            first_timestamp, _, sample_count = self.stats[stream_id]
+            if sample_count == 0:
+                first_timestamp = timestamps[0]
+            self.stats[stream_id] = (first_timestamp, timestamps[-1], sample_count + len(timestamps))
+
+    def get_backlog(self):
+        return self.queue.qsize()
+
+    def stop(self):
+        for puller in self.pullers:
+            puller.stop()
+        self.stop_event.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record LSL streams to XDF or HDF5.")
+    parser.add_argument("path", help="output file, .xdf or .h5")
+    parser.add_argument("--streams", nargs="+", help="names of the streams to record, all the streams found by default")
+    parser.add_argument("--resolve-timeout", type=float, default=RESOLVE_TIMEOUT_S, help="seconds to look for the streams")
+    parser.add_argument("--compression", choices=COMPRESSIONS, default="none", help="compression of the HDF5 datasets")
+    args = parser.parse_args()
+
+    lsl_streams = resolve_streams(wait_time=args.resolve_timeout)
+    if args.streams is not None:
+        lsl_streams = [lsl_stream for lsl_stream in lsl_streams if lsl_stream.name() in args.streams]
+        missing = set(args.streams) - set(lsl_stream.name() for lsl_stream in lsl_streams)
+        if len(missing) > 0:
+            print(f"Streams not found: {', '.join(sorted(missing))}")
+    if len(lsl_streams) == 0:
+        print("No stream to record")
+        return
+
+    if args.path.endswith(".xdf"):
+        sink = XdfSink(args.path)
+    else:
+        sink = Hdf5Sink(args.path, args.compression)
+
+    recorder = Recorder(lsl_streams, sink)
+    for lsl_stream in lsl_streams:
+        print(f"Recording {lsl_stream.name()} ({lsl_stream.type()}, {lsl_stream.channel_count()} channels at {lsl_stream.nominal_srate()} Hz)")
+    recorder.start()
+
+    try:
+        while True:
+            time.sleep(5)
+            samples = sum(sample_count for _, _, sample_count in recorder.stats.values())
+            print(f"{samples} samples written, {recorder.get_backlog()} chunks waiting")
+    except KeyboardInterrupt:
+        print("Stopping the recording...")
+        recorder.stop()
+        recorder.join()
+        print(f"Recording saved in {args.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+import argparse
+import collections
+import math
+import time
+import xml.etree.ElementTree as ET
+
+import numpy as np
+from pylsl import StreamInfo, StreamOutlet, local_clock
+
+from xdf_file import TAG_SAMPLES, TAG_STREAM_HEADER, XdfReader, XdfStream
+
+## Replay every stream of an XDF file on LSL, with the timing of the recording.
+##
+## poetry run python src/xdf/replay_xdf_to_lsl_streams.py recording.xdf
+## poetry run python src/xdf/replay_xdf_to_lsl_streams.py recording.xdf --speed 10
+
+TICK_MS = 20
+
+# seconds of recording read before they are due, chunks of a stream are written
+# about every second by LabRecorder, interleaved with the ones of other streams
+READ_AHEAD_S = 2
+
+# wait for the consumers to receive the last samples before closing the outlets
+END_LINGER_S = 1
+
+
+def copy_desc(xml_element: ET.Element, lsl_element):
+    for child in xml_element:
+        if len(child) == 0:
+            lsl_element.append_child_value(child.tag, child.text or "")
+        else:
+            copy_desc(child, lsl_element.append_child(child.tag))
+
+
+def create_outlet(stream: XdfStream):
+    info = StreamInfo(stream.name, stream.type, stream.channel_count, stream.nominal_srate, stream.channel_format, stream.source_id)
+    if stream.desc is not None:
+        copy_desc(stream.desc, info.desc())
+    return StreamOutlet(info)
+
+
+class XdfReplay():
+    """Read an XDF file a few seconds ahead of the replay, and push the samples when they are due.
+
+    Timestamps are aligned with the clock offsets of the recording, the
+    latest offset of a stream being applied to its following samples.
+    Replayed samples are stamped start + (timestamp - first timestamp), so
+    the streams keep their relative timing, at any speed.
+    """
+
+    def __init__(self, path: str, speed: float = 1, tick_ms: float = TICK_MS, wait_consumers_s: float = 0):
+        self.path = path
+        self.speed = speed
+        self.tick_ms = tick_ms
+        self.wait_consumers_s = wait_consumers_s
+
+        self.outlets = {}
+        # stream id -> deque of (timestamps, values) not pushed yet
+        self.pending = collections.defaultdict(collections.deque)
+
+        self.first_timestamp = None
+        self.start = None
+        self.pushed = 0
+
+    def read_until(self, chunks, record_time: float):
+        """Read the chunks starting before `record_time`, False at the end of the file."""
+        for tag, stream, payload in chunks:
+            if tag == TAG_STREAM_HEADER:
+                print(f"Replaying {stream.name} ({stream.type}, {stream.channel_count} channels at {stream.nominal_srate} Hz)")
+                self.outlets[stream.stream_id] = create_outlet(stream)
+
+            elif tag == TAG_SAMPLES:
+                timestamps, values = payload
+                if len(timestamps) == 0:
+                    continue
+                timestamps = timestamps + stream.clock_offset
+
+                if self.first_timestamp is None:
+                    self.wait_consumers()
+                    self.first_timestamp = timestamps[0]
+                    self.start = local_clock()
+                self.pending[stream.stream_id].append((timestamps, values))
+
+                if timestamps[0] > record_time:
+                    return True
+        return False
+
+    def wait_consumers(self):
+        # the headers of the streams are at the start of the file, before the samples
+        deadline = local_clock() + self.wait_consumers_s
+        for outlet in self.outlets.values():
+            outlet.wait_for_consumers(max(0, deadline - local_clock()))
+
+    def push_until(self, record_time: float):
+        for stream_id, pending in self.pending.items():
+            while len(pending) > 0:
+                timestamps, values = pending[0]
+                n_samples = np.searchsorted(timestamps, record_time, side="right")
+                if n_samples == 0:
+                    break
+
+                replay_timestamps = self.start + (timestamps[:n_samples] - self.first_timestamp)
+                self.outlets[stream_id].push_chunk(values[:n_samples], replay_timestamps.tolist())
+                self.pushed += n_samples
+
+                if n_samples == len(timestamps):
+                    pending.popleft()
+                else:
+                    pending[0] = (timestamps[n_samples:], values[n_samples:])
+                    break
+
+    def get_record_time(self):
+        if self.first_timestamp is None:
+            return -math.inf
+        return self.first_timestamp + (local_clock() - self.start) * self.speed
+
+    def run(self):
+        with XdfReader(self.path) as reader:
+            chunks = iter(reader)
+            reading = True
+            next_tick = local_clock()
+
+            while reading or any(len(pending) > 0 for pending in self.pending.values()):
+                if math.isinf(self.speed):
+                    # a chunk at a time, the order of the samples of each stream is kept
+                    reading = self.read_until(chunks, -math.inf)
+                    self.push_until(math.inf)
+                    continue
+
+                # absolute schedule, the time spent pushing does not accumulate
+                next_tick += self.tick_ms / 1000
+                time.sleep(max(0, next_tick - local_clock()))
+
+                record_time = self.get_record_time()
+                if reading:
+                    reading = self.read_until(chunks, record_time + READ_AHEAD_S * self.speed)
+                    # the first samples read start the replay
+                    record_time = self.get_record_time()
+                self.push_until(record_time)
+
+        print(f"Replay finished, {self.pushed} samples pushed.")
+        time.sleep(END_LINGER_S)
+
+
+def parse_speed(text: str):
+    if text == "max":
+        return math.inf
+    speed = float(text)
+    # at 0 the replay stalls, below it would go backwards
+    if not speed > 0:
+        raise argparse.ArgumentTypeError(f"speed must be positive, or 'max': {text}")
+    return speed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay the streams of an XDF file on LSL.")
+    parser.add_argument("path", help="XDF file, .xdf or .xdfz")
+    parser.add_argument("--speed", type=parse_speed, default=1, help="multiple of real time, or 'max' to replay as fast as possible")
+    parser.add_argument("--tick-ms", type=float, default=TICK_MS, help="period of the chunks")
+    parser.add_argument("--wait-consumers", type=float, default=0, help="seconds to wait for a consumer on every stream before the first samples")
+    args = parser.parse_args()
+
+    try:
+        XdfReplay(args.path, speed=args.speed, tick_ms=args.tick_ms, wait_consumers_s=args.wait_consumers).run()
+    except KeyboardInterrupt:
+        print("Streaming stopped.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+import gzip
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+## Incremental reader of XDF files, one chunk at a time, see
+## https://github.com/sccn/xdf/wiki/Specifications
+## Unlike pyxdf.load_xdf, nothing is kept in memory after a chunk is returned.
+
+TAG_FILE_HEADER = 1
+TAG_STREAM_HEADER = 2
+TAG_SAMPLES = 3
+TAG_CLOCK_OFFSET = 4
+TAG_BOUNDARY = 5
+TAG_STREAM_FOOTER = 6
+
+XDF_FORMAT_DTYPES = {
+    "float32": np.dtype("<f4"),
+    "double64": np.dtype("<f8"),
+    "int8": np.dtype("<i1"),
+    "int16": np.dtype("<i2"),
+    "int32": np.dtype("<i4"),
+    "int64": np.dtype("<i8"),
+}
+
+
+def read_varlen_int(buffer, offset: int):
+    """(value, next offset) of a variable length integer: 1 byte for its size, then the value."""
+    size = buffer[offset]
+    return int.from_bytes(buffer[offset + 1:offset + 1 + size], "little"), offset + 1 + size
+
+
+class XdfStream():
+    """A stream of an XDF file, from its StreamHeader chunk.
+
+    Samples can omit their timestamp, which is then deduced from the
+    previous one and the sampling rate, so the stream keeps the last
+    timestamp decoded.
+    """
+
+    def __init__(self, stream_id: int, header_xml: str):
+        self.stream_id = stream_id
+        self.header_xml = header_xml
+
+        root = ET.fromstring(header_xml)
+        self.name = root.findtext("name", "")
+        self.type = root.findtext("type", "")
+        self.channel_count = int(root.findtext("channel_count"))
+        self.nominal_srate = float(root.findtext("nominal_srate", "0"))
+        self.channel_format = root.findtext("channel_format")
+        self.source_id = root.findtext("source_id", "")
+        self.desc = root.find("desc")
+
+        # None for string streams
+        self.dtype = XDF_FORMAT_DTYPES.get(self.channel_format)
+
+        self.last_timestamp = 0.0
+        # latest offset between the clock of the stream and the one of the recorder
+        self.clock_offset = 0.0
+        self.footer_xml = None
+
+    def get_record_dtype(self, timestamp_bytes: int):
+        fields = [("timestamp_bytes", "u1")]
+        if timestamp_bytes > 0:
+            fields.append(("timestamp", "<f8"))
+        fields.append(("values", self.dtype, (self.channel_count,)))
+        return np.dtype(fields)
+
+    def decode_samples(self, content, offset: int):
+        """(timestamps, values) of a Samples chunk, values as a (samples, channels) array or a list of lists of str."""
+        n_samples, offset = read_varlen_int(content, offset)
+
+        if self.dtype is not None:
+            # numeric samples of a chunk almost always all have, or all omit,
+            # their timestamp, they are then fixed size records
+            for timestamp_bytes in [8, 0]:
+                record_dtype = self.get_record_dtype(timestamp_bytes)
+                if len(content) - offset != n_samples * record_dtype.itemsize:
+                    continue
+                records = np.frombuffer(content, dtype=record_dtype, count=n_samples, offset=offset)
+                if np.any(records["timestamp_bytes"] != timestamp_bytes):
+                    continue
+
+                if timestamp_bytes > 0:
+                    timestamps = records["timestamp"].copy()
+                else:
+                    timestamps = self.deduce_timestamps(n_samples)
+                if n_samples > 0:
+                    self.last_timestamp = timestamps[-1]
+                return timestamps, records["values"].copy()
+
+        return self.decode_samples_one_by_one(content, offset, n_samples)
+
+    def deduce_timestamps(self, n_samples: int):
+        step = 1 / self.nominal_srate if self.nominal_srate > 0 else 0
+        return self.last_timestamp + step * np.arange(1, n_samples + 1)
+
+    def decode_samples_one_by_one(self, content, offset: int, n_samples: int):
+        timestamps = np.zeros(n_samples)
+        if self.dtype is not None:
+            values = np.zeros((n_samples, self.channel_count), dtype=self.dtype)
+        else:
+            values = []
+        step = 1 / self.nominal_srate if self.nominal_srate > 0 else 0
+
+        for i in range(n_samples):
+            timestamp_bytes = content[offset]
+            offset += 1
+            if timestamp_bytes == 8:
+                self.last_timestamp = float(np.frombuffer(content, dtype="<f8", count=1, offset=offset)[0])
+                offset += 8
+            else:
+                self.last_timestamp += step
+            timestamps[i] = self.last_timestamp
+
+            if self.dtype is not None:
+                values[i] = np.frombuffer(content, dtype=self.dtype, count=self.channel_count, offset=offset)
+                offset += self.channel_count * self.dtype.itemsize
+            else:
+                sample = []
+                for _ in range(self.channel_count):
+                    length, offset = read_varlen_int(content, offset)
+                    sample.append(bytes(content[offset:offset + length]).decode("utf-8", errors="replace"))
+                    offset += length
+                values.append(sample)
+
+        return timestamps, values
+
+
+class XdfReader():
+    """Read an XDF file chunk by chunk.
+
+    Iterating yields (tag, stream, payload) tuples: (TAG_STREAM_HEADER,
+    stream, None), (TAG_SAMPLES, stream, (timestamps, values)),
+    (TAG_CLOCK_OFFSET, stream, (collection_time, offset)),
+    (TAG_STREAM_FOOTER, stream, None) and (TAG_BOUNDARY, None, None).
+    Timestamps are in the clock of their stream, add stream.clock_offset to
+    align the streams.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        if path.endswith(".xdfz"):
+            self.file = gzip.open(path, "rb")
+        else:
+            self.file = open(path, "rb")
+
+        if self.file.read(4) != b"XDF:":
+            self.file.close()
+            raise ValueError(f"{path} is not an XDF file")
+
+        self.header_xml = None
+        self.streams = {}
+        # position in the file of the last chunk read
+        self.chunk_offset = None
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def read_chunk(self):
+        """(tag, content) of the next chunk, content starting after the tag, or None at the end of the file."""
+        self.chunk_offset = self.file.tell()
+        size_bytes = self.file.read(1)
+        if len(size_bytes) == 0:
+            return None
+
+        length_bytes = self.file.read(size_bytes[0])
+        length = int.from_bytes(length_bytes, "little")
+        chunk = self.file.read(length)
+        if len(length_bytes) < size_bytes[0] or len(chunk) < length:
+            # a recording interrupted in the middle of a chunk
+            print(f"Truncated chunk at {self.chunk_offset} in {self.path}")
+            return None
+
+        tag = int.from_bytes(chunk[:2], "little")
+        return tag, memoryview(chunk)[2:]
+
+    def __iter__(self):
+        while True:
+            chunk = self.read_chunk()
+            if chunk is None:
+                return
+            tag, content = chunk
+
+            if tag == TAG_FILE_HEADER:
+                self.header_xml = bytes(content).decode("utf-8")
+                continue
+            if tag == TAG_BOUNDARY:
+                yield tag, None, None
+                continue
+
+            stream_id = int.from_bytes(content[:4], "little")
+            if tag == TAG_STREAM_HEADER:
+                stream = XdfStream(stream_id, bytes(content[4:]).decode("utf-8"))
+                self.streams[stream_id] = stream
+                yield tag, stream, None
+                continue
+
+            stream = self.streams.get(stream_id)
+            if stream is None:
+                # the header of this stream was not recorded
+                continue
+
+            if tag == TAG_SAMPLES:
+                yield tag, stream, stream.decode_samples(content, 4)
+            elif tag == TAG_CLOCK_OFFSET:
+                collection_time, offset = np.frombuffer(content, dtype="<f8", count=2, offset=4)
+                stream.clock_offset = float(offset)
+                yield tag, stream, (float(collection_time), float(offset))
+            elif tag == TAG_STREAM_FOOTER:
+                stream.footer_xml = bytes(content[4:]).decode("utf-8")
+                yield tag, stream, None
+
+
+def write_varlen_int(value: int):
+    if value < 2 ** 8:
+        return bytes([1]) + value.to_bytes(1, "little")
+    if value < 2 ** 32:
+        return bytes([4]) + value.to_bytes(4, "little")
+    return bytes([8]) + value.to_bytes(8, "little")
+
+
+# 16 bytes written as is in boundary chunks, to find chunks again in a corrupted file
+BOUNDARY_UUID = bytes.fromhex("43a5464ce6c7bbe6ee4fa51f05ffd4ab")
+
+
+class XdfWriter():
+    """Write an XDF file chunk by chunk, samples always with their timestamp."""
+
+    def __init__(self, path: str):
+        self.file = open(path, "wb")
+        self.file.write(b"XDF:")
+        self.write_chunk(TAG_FILE_HEADER, b'<?xml version="1.0"?><info><version>1.0</version></info>')
+
+    def close(self):
+        self.file.close()
+
+    def write_chunk(self, tag: int, content: bytes, stream_id: int = None):
+        if stream_id is not None:
+            content = stream_id.to_bytes(4, "little") + content
+        self.file.write(write_varlen_int(len(content) + 2))
+        self.file.write(tag.to_bytes(2, "little"))
+        self.file.write(content)
+
+    def write_stream_header(self, stream: XdfStream):
+        self.write_chunk(TAG_STREAM_HEADER, stream.header_xml.encode("utf-8"), stream.stream_id)
+
+    def write_stream_footer(self, stream_id: int, footer_xml: str):
+        self.write_chunk(TAG_STREAM_FOOTER, footer_xml.encode("utf-8"), stream_id)
+
+    def write_samples(self, stream: XdfStream, timestamps, values):
+        n_samples = len(timestamps)
+        if stream.dtype is not None:
+            records = np.empty(n_samples, dtype=stream.get_record_dtype(8))
+            records["timestamp_bytes"] = 8
+            records["timestamp"] = timestamps
+            records["values"] = values
+            samples = records.tobytes()
+        else:
+            parts = []
+            for timestamp, sample in zip(timestamps, values):
+                parts.append(b"\x08" + np.float64(timestamp).tobytes())
+                for value in sample:
+                    encoded = value.encode("utf-8")
+                    parts.append(write_varlen_int(len(encoded)) + encoded)
+            samples = b"".join(parts)
+        self.write_chunk(TAG_SAMPLES, write_varlen_int(n_samples) + samples, stream.stream_id)
+
+    def write_clock_offset(self, stream_id: int, collection_time: float, offset: float):
+        self.write_chunk(TAG_CLOCK_OFFSET, np.array([collection_time, offset], dtype="<f8").tobytes(), stream_id)
+
+    def write_boundary(self):
+        self.write_chunk(TAG_BOUNDARY, BOUNDARY_UUID)
@@ -0,0 +1,235 @@
+import json
+import os
+from typing import Union
+
+import numpy as np
+
+from xdf_file import TAG_BOUNDARY, TAG_CLOCK_OFFSET, TAG_SAMPLES, TAG_STREAM_FOOTER, TAG_STREAM_HEADER, XdfReader, XdfStream
+
+## Random access to the samples of an XDF file, through an index of its chunks.
+##
+## reader = IndexedXdfReader("recording.xdf")
+## timestamps, values = reader.read("ReplayHexoskinECG", t0, t0 + 30)
+
+INDEX_VERSION = 1
+
+
+def get_index_path(path: str):
+    return f"{path}.index.npz"
+
+
+class XdfIndex():
+    """Position and timestamp range of every Samples chunk of an XDF file, by stream.
+
+    Building it decodes the whole file once. It is then saved next to the
+    file, and loaded instead of built while the size and modification time
+    of the file are unchanged.
+    """
+
+    def __init__(self):
+        self.file_size = None
+        self.file_mtime_ns = None
+        self.header_xmls = {}
+        self.footer_xmls = {}
+        self.boundary_offsets = np.zeros(0, dtype=np.int64)
+
+        # stream id -> arrays with one value per Samples chunk
+        self.chunk_offsets = {}
+        self.first_timestamps = {}
+        self.last_timestamps = {}
+        # last timestamp before the chunk, for samples that omit their timestamp
+        self.previous_timestamps = {}
+        self.sample_counts = {}
+
+        # stream id -> (collection times, offsets)
+        self.clock_offsets = {}
+
+    @classmethod
+    def build(cls, path: str):
+        index = cls()
+        stat = os.stat(path)
+        index.file_size = stat.st_size
+        index.file_mtime_ns = stat.st_mtime_ns
+
+        chunks = {}
+        clock_offsets = {}
+        boundary_offsets = []
+        with XdfReader(path) as reader:
+            for tag, stream, payload in reader:
+                if tag == TAG_STREAM_HEADER:
+                    index.header_xmls[stream.stream_id] = stream.header_xml
+                    chunks[stream.stream_id] = []
+                    clock_offsets[stream.stream_id] = []
+                elif tag == TAG_SAMPLES:
+                    previous_timestamp = stream.last_timestamp
+                    timestamps, _ = payload
+                    if len(timestamps) > 0:
+                        chunks[stream.stream_id].append((reader.chunk_offset, timestamps[0], timestamps[-1], previous_timestamp, len(timestamps)))
+                elif tag == TAG_CLOCK_OFFSET:
+                    clock_offsets[stream.stream_id].append(payload)
+                elif tag == TAG_STREAM_FOOTER:
+                    index.footer_xmls[stream.stream_id] = stream.footer_xml
+                elif tag == TAG_BOUNDARY:
+                    boundary_offsets.append(reader.chunk_offset)
+
+        for stream_id, stream_chunks in chunks.items():
+            stream_chunks = np.array(stream_chunks, dtype=np.float64).reshape(-1, 5)
+            index.chunk_offsets[stream_id] = stream_chunks[:, 0].astype(np.int64)
+            index.first_timestamps[stream_id] = stream_chunks[:, 1]
+            index.last_timestamps[stream_id] = stream_chunks[:, 2]
+            index.previous_timestamps[stream_id] = stream_chunks[:, 3]
+            index.sample_counts[stream_id] = stream_chunks[:, 4].astype(np.int64)
+
+            offsets = np.array(clock_offsets[stream_id], dtype=np.float64).reshape(-1, 2)
+            index.clock_offsets[stream_id] = (offsets[:, 0], offsets[:, 1])
+        index.boundary_offsets = np.array(boundary_offsets, dtype=np.int64)
+        return index
+
+    def save(self, index_path: str):
+        meta = {
+            "version": INDEX_VERSION,
+            "file_size": self.file_size,
+            "file_mtime_ns": self.file_mtime_ns,
+            "header_xmls": self.header_xmls,
+            "footer_xmls": self.footer_xmls,
+        }
+        arrays = {"meta": np.array(json.dumps(meta)), "boundary_offsets": self.boundary_offsets}
+        for stream_id in self.chunk_offsets:
+            arrays[f"{stream_id}/chunk_offsets"] = self.chunk_offsets[stream_id]
+            arrays[f"{stream_id}/first_timestamps"] = self.first_timestamps[stream_id]
+            arrays[f"{stream_id}/last_timestamps"] = self.last_timestamps[stream_id]
+            arrays[f"{stream_id}/previous_timestamps"] = self.previous_timestamps[stream_id]
+            arrays[f"{stream_id}/sample_counts"] = self.sample_counts[stream_id]
+            arrays[f"{stream_id}/clock_offset_times"] = self.clock_offsets[stream_id][0]
+            arrays[f"{stream_id}/clock_offset_values"] = self.clock_offsets[stream_id][1]
+
+        # np.savez adds .npz to names without it
+        tmp_path = f"{index_path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, index_path)
+
+    @classmethod
+    def load(cls, index_path: str):
+        index = cls()
+        with np.load(index_path) as arrays:
+            meta = json.loads(str(arrays["meta"]))
+            if meta["version"] != INDEX_VERSION:
+                return None
+
+            index.file_size = meta["file_size"]
+            index.file_mtime_ns = meta["file_mtime_ns"]
+            # json keys are strings
+            index.header_xmls = {int(stream_id): xml for stream_id, xml in meta["header_xmls"].items()}
+            index.footer_xmls = {int(stream_id): xml for stream_id, xml in meta["footer_xmls"].items()}
+            index.boundary_offsets = arrays["boundary_offsets"]
+
+            for stream_id in index.header_xmls:
+                index.chunk_offsets[stream_id] = arrays[f"{stream_id}/chunk_offsets"]
+                index.first_timestamps[stream_id] = arrays[f"{stream_id}/first_timestamps"]
+                index.last_timestamps[stream_id] = arrays[f"{stream_id}/last_timestamps"]
+                index.previous_timestamps[stream_id] = arrays[f"{stream_id}/previous_timestamps"]
+                index.sample_counts[stream_id] = arrays[f"{stream_id}/sample_counts"]
+                index.clock_offsets[stream_id] = (arrays[f"{stream_id}/clock_offset_times"], arrays[f"{stream_id}/clock_offset_values"])
+        return index
+
+    def matches(self, path: str):
+        stat = os.stat(path)
+        return self.file_size == stat.st_size and self.file_mtime_ns == stat.st_mtime_ns
+
+    @classmethod
+    def open(cls, path: str):
+        index_path = get_index_path(path)
+        if os.path.exists(index_path):
+            index = cls.load(index_path)
+            if index is not None and index.matches(path):
+                return index
+
+        print(f"Indexing {path}")
+        index = cls.build(path)
+        try:
+            index.save(index_path)
+        except OSError as e:
+            # a read-only directory, the index is only kept in memory
+            print(f"Failed to save the index of {path}: {e}")
+        return index
+
+
+class IndexedXdfReader():
+    """Read the samples of one stream between two timestamps, decoding only the chunks needed."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.index = XdfIndex.open(path)
+        self.streams = {stream_id: XdfStream(stream_id, xml) for stream_id, xml in self.index.header_xmls.items()}
+        self.reader = XdfReader(path)
+
+    def close(self):
+        self.reader.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def get_stream(self, stream: Union[int, str]):
+        """A stream by id, or by name."""
+        if isinstance(stream, int):
+            return self.streams[stream]
+        for candidate in self.streams.values():
+            if candidate.name == stream:
+                return candidate
+        raise KeyError(f"No stream named {stream} in {self.path}")
+
+    def get_time_range(self, stream: Union[int, str]):
+        stream_id = self.get_stream(stream).stream_id
+        if len(self.index.chunk_offsets[stream_id]) == 0:
+            return None
+        return self.index.first_timestamps[stream_id].min(), self.index.last_timestamps[stream_id].max()
+
+    def read(self, stream: Union[int, str], t0: float = -np.inf, t1: float = np.inf):
+        """(timestamps, values) of the samples of `stream` with t0 <= timestamp < t1.
+
+        Timestamps are in the clock of the stream, as in the file. Values
+        are a (samples, channels) array, or a list of lists of str.
+        """
+        stream = self.get_stream(stream)
+        stream_id = stream.stream_id
+        needed = (self.index.last_timestamps[stream_id] >= t0) & (self.index.first_timestamps[stream_id] < t1)
+
+        all_timestamps = []
+        all_values = []
+        for chunk_id in np.flatnonzero(needed):
+            self.reader.file.seek(self.index.chunk_offsets[stream_id][chunk_id])
+            _, content = self.reader.read_chunk()
+
+            stream.last_timestamp = self.index.previous_timestamps[stream_id][chunk_id]
+            timestamps, values = stream.decode_samples(content, 4)
+
+            kept = (timestamps >= t0) & (timestamps < t1)
+            all_timestamps.append(timestamps[kept])
+            if stream.dtype is not None:
+                all_values.append(values[kept])
+            else:
+                all_values.append([sample for sample, keep in zip(values, kept) if keep])
+
+        if len(all_timestamps) == 0:
+            if stream.dtype is not None:
+                return np.zeros(0), np.zeros((0, stream.channel_count), dtype=stream.dtype)
+            return np.zeros(0), []
+
+        timestamps = np.concatenate(all_timestamps)
+        if stream.dtype is not None:
+            values = np.concatenate(all_values)
+        else:
+            values = [sample for chunk_values in all_values for sample in chunk_values]
+
+        # chunks are written in order, except when a recording was interrupted
+        if np.any(np.diff(timestamps) < 0):
+            order = np.argsort(timestamps, kind="stable")
+            timestamps = timestamps[order]
+            if stream.dtype is not None:
+                values = values[order]
+            else:
+                values = [values[i] for i in order]
+        return timestamps, values